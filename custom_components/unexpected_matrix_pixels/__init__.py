@@ -1,31 +1,75 @@
 from __future__ import annotations
 import logging
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.const import Platform
-from .const import DOMAIN, CONF_MAC_ADDRESS, CONF_WIDTH, CONF_HEIGHT, DEFAULT_WIDTH, DEFAULT_HEIGHT
-from .ble_client import UmpBleClient
+from typing import TYPE_CHECKING
+from .const import (
+    DOMAIN, DATA_CLIENTS, CONF_MAC_ADDRESS, CONF_WIDTH, CONF_HEIGHT, CONF_RENDER_WORKERS,
+    CONF_CACHE_MB, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_RENDER_WORKERS, DEFAULT_CACHE_MB,
+)
 
-# Added Platform.CAMERA here
-PLATFORMS = [Platform.LIGHT, Platform.CAMERA]
+_LOGGER = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from homeassistant.config_entries import ConfigEntry
+    from homeassistant.core import HomeAssistant
+
+# Home Assistant is only imported inside the setup functions so the package
+# (renderer.py, scene.py, text.py) stays importable without it.
+PLATFORMS = ["light", "camera"]
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    from .animation import async_get_clock
+    from .ble_client import async_get_client
+    from .bitmap_fonts import FONT_DIR
+    from .cache import CACHE
+    from .text import load_user_fonts
     hass.data.setdefault(DOMAIN, {})
+    # One render cache for the whole integration; the largest budget wins
+    cache_mb = max([
+        e.options.get(CONF_CACHE_MB, DEFAULT_CACHE_MB)
+        for e in hass.config_entries.async_entries(DOMAIN)
+        if e.entry_id in hass.data[DOMAIN]
+    ] + [entry.options.get(CONF_CACHE_MB, DEFAULT_CACHE_MB)])
+    CACHE.set_budget(cache_mb * 2**20)
+    # BDF/PCF fonts from <config>/ump_fonts; compiled once, then just mmapped
+    fonts = await hass.async_add_executor_job(load_user_fonts, hass.config.path(FONT_DIR))
+    if fonts:
+        _LOGGER.info(f"Loaded bitmap fonts: {', '.join(fonts)}")
     mac = entry.data[CONF_MAC_ADDRESS]
     width = entry.data.get(CONF_WIDTH, DEFAULT_WIDTH)
     height = entry.data.get(CONF_HEIGHT, DEFAULT_HEIGHT)
-    client = UmpBleClient(hass, mac, width, height)
+    client = async_get_client(hass, mac, width, height)
     hass.data[DOMAIN][entry.entry_id] = {
         "client": client, 
         "data": entry.data,
         "width": width,
         "height": height
     }
+    workers = entry.options.get(CONF_RENDER_WORKERS, DEFAULT_RENDER_WORKERS)
+    if workers:
+        # Opt-in: heavy animations render in worker processes
+        try:
+            await async_get_clock(hass).async_use_process_pool(workers, hass.config.path(FONT_DIR))
+        except Exception as e:
+            _LOGGER.error(f"Could not start render workers, rendering in process: {e}")
+    entry.async_on_unload(entry.add_update_listener(_async_options_updated))
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
+async def _async_options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+        hass.data.get(DATA_CLIENTS, {}).pop(entry.data[CONF_MAC_ADDRESS], None)
+        await entry_data["client"].disconnect()
+        from .animation import async_get_clock
+        wanted = [
+            e.options.get(CONF_RENDER_WORKERS, DEFAULT_RENDER_WORKERS)
+            for e in hass.config_entries.async_entries(DOMAIN)
+            if e.entry_id in hass.data[DOMAIN]
+        ]
+        if not any(wanted):
+            await async_get_clock(hass).async_shutdown_pool()
     return unload_ok
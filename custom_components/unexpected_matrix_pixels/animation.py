@@ -0,0 +1,181 @@
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import Event, HomeAssistant
+from .const import DATA_CLOCK
+from .render_pool import RenderPool, wants_pool
+from .renderer import SceneRenderer, encode_frame
+from .scene import Scene
+
+_LOGGER = logging.getLogger(__name__)
+
+# Frames are due on a grid of 1/fps from a shared epoch, so panels with the
+# same fps wake on the same tick and scroll in phase.
+SendCallback = Callable[[bytes], None]
+
+
+class _Animation:
+    __slots__ = ("renderer", "scene", "send", "period", "next_due", "pooled")
+
+    def __init__(self, renderer: SceneRenderer, scene: Scene, send: SendCallback, next_due: float) -> None:
+        self.renderer = renderer
+        self.scene = scene
+        self.send = send
+        self.period = 1.0 / max(1, min(scene.fps, 30))
+        self.next_due = next_due
+        # Rendered by the process pool instead of the executor batch
+        self.pooled = False
+
+
+def _render_batch(jobs: List[Tuple[SceneRenderer, Scene, float]]) -> List[Optional[bytes]]:
+    # Runs in the executor: one hop per tick for every display that is due
+    frames = []
+    for renderer, scene, now in jobs:
+        try:
+            frames.append(encode_frame(renderer.render(scene.elements, scene.background, now), *renderer.size))
+        except Exception as e:
+            _LOGGER.error(f"Rendering animation frame failed: {e}")
+            frames.append(None)
+    return frames
+
+
+class AnimationClock:
+    # One monotonic ticker for every animated display of the integration
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._epoch = time.monotonic()
+        self._animations: Dict[Any, _Animation] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._pool: Optional[RenderPool] = None
+        self._stop_listener: Optional[Callable[[], None]] = None
+
+    def _next_tick(self, period: float, after: float) -> float:
+        return self._epoch + (math.floor((after - self._epoch) / period) + 1) * period
+
+    def start(self, key: Any, renderer: SceneRenderer, scene: Scene, send: SendCallback,
+              images: Optional[Dict[int, Any]] = None) -> None:
+        # Replaces whatever `key` was animating; the first frame is due right away.
+        # `images` are the scene's decoded source images, for the process pool.
+        now = time.monotonic()
+        anim = _Animation(renderer, scene, send, now)
+        if self._pool and scene.definition is not None and wants_pool(scene):
+            try:
+                self._pool.prepare(key, scene, images or {}, renderer.size)
+                anim.pooled = True
+            except Exception as e:
+                _LOGGER.warning(f"Rendering in process instead of the render pool: {e}")
+        elif self._pool:
+            self._pool.release(key)
+        self._animations[key] = anim
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = self._hass.async_create_task(self._run())
+
+    def stop(self, key: Any) -> None:
+        if self._pool:
+            self._pool.release(key)
+        if self._animations.pop(key, None) is not None:
+            self._wake.set()
+
+    def hold(self, key: Any, seconds: float) -> None:
+        # Skip frames for a while, e.g. while the panel is unreachable
+        anim = self._animations.get(key)
+        if anim:
+            anim.next_due = self._next_tick(anim.period, time.monotonic() + seconds)
+
+    def is_running(self, key: Any) -> bool:
+        return key in self._animations
+
+    async def async_use_process_pool(self, workers: int, font_dir: Optional[str] = None) -> None:
+        # Opt-in; the largest worker count asked for by any entry wins.
+        # Only scenes started afterwards are rendered by the pool.
+        if self._pool and self._pool.workers >= workers: return
+        await self.async_shutdown_pool()
+        pool = RenderPool(workers, font_dir)
+        await self._hass.async_add_executor_job(pool.start)
+        self._pool = pool
+        if self._stop_listener is None:
+            # Entries are not unloaded on shutdown: stop the workers and free
+            # the shared memory here rather than leaving it to atexit
+            self._stop_listener = self._hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STOP, self._async_on_stop)
+        _LOGGER.info(f"Rendering heavy scenes in {workers} worker processes")
+
+    async def _async_on_stop(self, event: Event) -> None:
+        self._stop_listener = None
+        await self.async_shutdown_pool()
+
+    async def async_shutdown_pool(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is None: return
+        for anim in self._animations.values():
+            anim.pooled = False
+        await self._hass.async_add_executor_job(pool.shutdown)
+
+    async def _render_due(self, due: List[Tuple[Any, _Animation]]) -> List[Optional[bytes]]:
+        # Light scenes in one executor batch, heavy ones spread over the pool
+        pool = self._pool
+        batch = [(i, anim) for i, (_, anim) in enumerate(due) if not (pool and anim.pooled)]
+        pooled = [(i, key, anim) for i, (key, anim) in enumerate(due) if pool and anim.pooled]
+
+        async def render_batch() -> List[Optional[bytes]]:
+            if not batch: return []
+            jobs = [(anim.renderer, anim.scene, anim.next_due) for _, anim in batch]
+            return await self._hass.async_add_executor_job(_render_batch, jobs)
+
+        results = await asyncio.gather(
+            render_batch(),
+            *(pool.render(key, anim.next_due) for _, key, anim in pooled),
+            return_exceptions=True,
+        )
+        frames: List[Optional[bytes]] = [None] * len(due)
+        batch_frames = results[0] if not isinstance(results[0], BaseException) else [None] * len(batch)
+        for (i, _), frame in zip(batch, batch_frames):
+            frames[i] = frame
+        for (i, _, _), frame in zip(pooled, results[1:]):
+            if isinstance(frame, BaseException):
+                _LOGGER.error(f"Rendering animation frame in the pool failed: {frame}")
+                continue
+            frames[i] = frame
+        return frames
+
+    async def _run(self) -> None:
+        try:
+            while self._animations:
+                now = time.monotonic()
+                due = [(key, anim) for key, anim in self._animations.items() if anim.next_due <= now]
+                if due:
+                    # Render at the tick time, not the wake-up time, so every
+                    # display due on this tick gets the same animation phase
+                    frames = await self._render_due(due)
+                    done = time.monotonic()
+                    for (key, anim), frame in zip(due, frames):
+                        if self._animations.get(key) is not anim: continue
+                        # Late ticks are dropped rather than rendered as a burst
+                        anim.next_due = self._next_tick(anim.period, max(anim.next_due, done))
+                        if frame is not None:
+                            anim.send(frame)
+                    continue
+
+                self._wake.clear()
+                delay = min(anim.next_due for anim in self._animations.values()) - now
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            _LOGGER.error(f"Animation clock crashed: {e}")
+
+
+def async_get_clock(hass: HomeAssistant) -> AnimationClock:
+    clock = hass.data.get(DATA_CLOCK)
+    if clock is None:
+        clock = hass.data[DATA_CLOCK] = AnimationClock(hass)
+    return clock
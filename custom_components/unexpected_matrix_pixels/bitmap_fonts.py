@@ -0,0 +1,304 @@
+from __future__ import annotations
+import gzip
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+
+_LOGGER = logging.getLogger(__name__)
+
+# User bitmap fonts (BDF, PCF, PCF.gz) from <config>/ump_fonts, usable by name
+# in the `font:` field. Each is compiled once into a .umpf file next to the
+# source and read back through mmap on later starts.
+#
+# .umpf layout: header, count glyph records sorted by codepoint, then the
+# glyph bitmaps as 1-bit rows padded to whole bytes (PIL "1" raw format).
+_MAGIC = b"UMPF"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHIhhII")  # magic, version, count, line height, ascent, source size, source mtime
+_RECORD = struct.Struct("<IIhhhHH")  # codepoint, bitmap offset, advance, x offset, y offset, width, height
+
+FONT_DIR = "ump_fonts"
+FONT_EXTENSIONS = (".bdf", ".pcf", ".pcf.gz")
+CACHE_EXTENSION = ".umpf"
+
+# (codepoint, advance, x offset, y offset from the top of the line, width, height, packed rows)
+RawGlyph = Tuple[int, int, int, int, int, int, bytes]
+
+_FONTS: Dict[str, "BitmapFont"] = {}
+_LOCK = threading.Lock()
+
+
+# --- BDF ---
+
+def _parse_bdf(data: bytes) -> Tuple[int, int, List[RawGlyph]]:
+    glyphs: List[RawGlyph] = []
+    ascent = descent = None
+    bbox = (0, 0, 0, 0)
+    lines = iter(data.decode("latin-1").splitlines())
+    for line in lines:
+        parts = line.split()
+        if not parts: continue
+        key = parts[0]
+        if key == "FONTBOUNDINGBOX":
+            bbox = tuple(int(v) for v in parts[1:5])
+        elif key == "FONT_ASCENT":
+            ascent = int(parts[1])
+        elif key == "FONT_DESCENT":
+            descent = int(parts[1])
+        elif key == "STARTCHAR":
+            code = -1
+            advance = None
+            w, h, xoff, yoff = bbox
+            rows: List[bytes] = []
+            for line in lines:
+                parts = line.split()
+                if not parts: continue
+                key = parts[0]
+                if key == "ENCODING":
+                    code = int(parts[1])
+                elif key == "DWIDTH":
+                    advance = int(parts[1])
+                elif key == "BBX":
+                    w, h, xoff, yoff = (int(v) for v in parts[1:5])
+                elif key == "BITMAP":
+                    row_bytes = (w + 7) // 8
+                    for _ in range(h):
+                        rows.append(bytes.fromhex(next(lines).strip())[:row_bytes].ljust(row_bytes, b"\0"))
+                elif key == "ENDCHAR":
+                    break
+            if code < 0: continue
+            glyphs.append((code, advance if advance is not None else w, xoff, yoff + h, w, h, b"".join(rows)))
+
+    if ascent is None: ascent = bbox[1] + bbox[3]
+    if descent is None: descent = -bbox[3]
+    # yoff + h is the glyph's top above the baseline; make it relative to the line top
+    glyphs = [(c, adv, xo, ascent - top, w, h, rows) for c, adv, xo, top, w, h, rows in glyphs]
+    return ascent, ascent + descent, glyphs
+
+
+# --- PCF ---
+
+_PCF_MAGIC = b"\x01fcp"
+_PCF_ACCELERATORS = 1 << 1
+_PCF_METRICS = 1 << 2
+_PCF_BITMAPS = 1 << 3
+_PCF_BDF_ENCODINGS = 1 << 5
+_PCF_BDF_ACCELERATORS = 1 << 8
+_PCF_COMPRESSED_METRICS = 0x100
+_PCF_BYTE_MASK = 1 << 2
+_PCF_BIT_MASK = 1 << 3
+
+
+def _reverse_bits(value: int) -> int:
+    return int(f"{value:08b}"[::-1], 2)
+
+
+_BIT_REVERSE = bytes(_reverse_bits(i) for i in range(256))
+
+
+def _parse_pcf(data: bytes) -> Tuple[int, int, List[RawGlyph]]:
+    if data[:4] != _PCF_MAGIC:
+        raise ValueError("not a PCF font")
+    count = struct.unpack_from("<I", data, 4)[0]
+    tables = {}
+    for i in range(count):
+        kind, fmt, _, offset = struct.unpack_from("<IIII", data, 8 + 16 * i)
+        tables[kind] = (fmt, offset)
+
+    def table(kind: int) -> Tuple[int, int, str]:
+        fmt, offset = tables[kind]
+        # Every table repeats its format (always little endian) first
+        fmt = struct.unpack_from("<I", data, offset)[0]
+        return fmt, offset + 4, ">" if fmt & _PCF_BYTE_MASK else "<"
+
+    fmt, pos, order = table(_PCF_BDF_ACCELERATORS if _PCF_BDF_ACCELERATORS in tables else _PCF_ACCELERATORS)
+    ascent, descent = struct.unpack_from(f"{order}ii", data, pos + 8)
+
+    fmt, pos, order = table(_PCF_METRICS)
+    metrics = []
+    if fmt & _PCF_COMPRESSED_METRICS:
+        n = struct.unpack_from(f"{order}H", data, pos)[0]
+        for i in range(n):
+            lsb, rsb, adv, asc, desc = (v - 0x80 for v in data[pos + 2 + 5 * i:pos + 7 + 5 * i])
+            metrics.append((lsb, rsb, adv, asc, desc))
+    else:
+        n = struct.unpack_from(f"{order}I", data, pos)[0]
+        for i in range(n):
+            metrics.append(struct.unpack_from(f"{order}hhhhh", data, pos + 4 + 12 * i))
+
+    fmt, pos, order = table(_PCF_BITMAPS)
+    n = struct.unpack_from(f"{order}I", data, pos)[0]
+    offsets = struct.unpack_from(f"{order}{n}I", data, pos + 4)
+    bitmaps = pos + 4 + 4 * n + 16
+    pad = 1 << (fmt & 3)
+    unit = 1 << ((fmt >> 4) & 3)
+    lsb_bits = not fmt & _PCF_BIT_MASK
+    swap = bool(fmt & _PCF_BYTE_MASK) != bool(fmt & _PCF_BIT_MASK)
+
+    fmt, pos, order = table(_PCF_BDF_ENCODINGS)
+    min2, max2, min1, max1, _ = struct.unpack_from(f"{order}hhhhh", data, pos)
+    cols = max2 - min2 + 1
+    indexes = struct.unpack_from(f"{order}{cols * (max1 - min1 + 1)}H", data, pos + 10)
+
+    glyphs: List[RawGlyph] = []
+    for i, index in enumerate(indexes):
+        if index == 0xFFFF or index >= len(metrics): continue
+        code = ((min1 + i // cols) << 8) | (min2 + i % cols)
+        lsb, rsb, adv, asc, desc = metrics[index]
+        w, h = max(0, rsb - lsb), max(0, asc + desc)
+        stride = ((w + 7) // 8 + pad - 1) // pad * pad
+        raw = data[bitmaps + offsets[index]:bitmaps + offsets[index] + stride * h]
+        if swap and unit > 1:
+            raw = b"".join(raw[j:j + unit][::-1] for j in range(0, len(raw), unit))
+        if lsb_bits:
+            raw = raw.translate(_BIT_REVERSE)
+        row_bytes = (w + 7) // 8
+        rows = b"".join(raw[r * stride:r * stride + row_bytes] for r in range(h))
+        glyphs.append((code, adv, lsb, ascent - asc, w, h, rows))
+    return ascent, ascent + descent, glyphs
+
+
+# --- COMPILED FONTS ---
+
+def compile_font(path: str) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".gz"):
+        data = gzip.decompress(data)
+    if data[:4] == _PCF_MAGIC:
+        ascent, line_h, glyphs = _parse_pcf(data)
+    else:
+        ascent, line_h, glyphs = _parse_bdf(data)
+
+    glyphs.sort(key=lambda g: g[0])
+    st = os.stat(path)
+    out = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(glyphs), line_h, ascent, st.st_size, int(st.st_mtime)))
+    blob = bytearray()
+    for code, adv, xo, yo, w, h, rows in glyphs:
+        out += _RECORD.pack(code, len(blob), adv, xo, yo, w, h)
+        blob += rows
+    return bytes(out + blob)
+
+
+class BitmapFont:
+    def __init__(self, name: str, buf) -> None:
+        self.name = name
+        self._buf = buf
+        _, _, self._count, self.line_height, self.ascent, _, _ = _HEADER.unpack_from(buf, 0)
+        self._bitmaps = _HEADER.size + _RECORD.size * self._count
+        self._translation: Optional[Dict[int, str]] = None
+        space = self._find(ord(" "))
+        self.space_advance = space[2] if space else max(1, self.line_height // 3)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _find(self, code: int) -> Optional[tuple]:
+        buf = self._buf
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = _RECORD.unpack_from(buf, _HEADER.size + _RECORD.size * mid)
+            if record[0] == code:
+                return record
+            if record[0] < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def has(self, code: int) -> bool:
+        return self._find(code) is not None
+
+    def glyph(self, char: str) -> Tuple[Optional[Image.Image], int, int, int]:
+        # Same (mask, advance, x offset, y offset) shape as text.get_glyph
+        record = self._find(ord(char))
+        if record is None:
+            return None, self.space_advance, 0, 0
+        _, offset, adv, xo, yo, w, h = record
+        if w == 0 or h == 0:
+            return None, adv, xo, yo
+        start = self._bitmaps + offset
+        mask = Image.frombytes("1", (w, h), bytes(self._buf[start:start + (w + 7) // 8 * h]))
+        return mask, adv, xo, yo
+
+    def translation(self, table: Dict[int, str]) -> Dict[int, str]:
+        # The transliteration table minus the characters this font can draw
+        if self._translation is None:
+            self._translation = {code: repl for code, repl in table.items() if not self.has(code)}
+        return self._translation
+
+
+def _font_name(path: str) -> str:
+    name = os.path.basename(path)
+    for ext in FONT_EXTENSIONS[::-1]:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def _is_current(buf, source: os.stat_result) -> bool:
+    if len(buf) < _HEADER.size: return False
+    magic, version, _, _, _, size, mtime = _HEADER.unpack_from(buf, 0)
+    return magic == _MAGIC and version == _VERSION and size == source.st_size and mtime == int(source.st_mtime)
+
+
+def load_font(path: str) -> BitmapFont:
+    name = _font_name(path)
+    cache_path = os.path.join(os.path.dirname(path), name + CACHE_EXTENSION)
+    source = os.stat(path)
+
+    if os.path.exists(cache_path) and os.path.getsize(cache_path) >= _HEADER.size:
+        with open(cache_path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if _is_current(buf, source):
+            return BitmapFont(name, buf)
+        buf.close()
+
+    data = compile_font(path)
+    try:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+        with open(cache_path, "rb") as f:
+            return BitmapFont(name, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except OSError as e:
+        _LOGGER.debug(f"Could not write font cache {cache_path}: {e}")
+        return BitmapFont(name, data)
+
+
+def load_font_dir(directory: str, reserved: Tuple[str, ...] = ()) -> List[str]:
+    # Blocking; returns the names of fonts that were added or changed
+    if not os.path.isdir(directory): return []
+    changed = []
+    with _LOCK:
+        for entry in sorted(os.listdir(directory)):
+            if not entry.lower().endswith(FONT_EXTENSIONS): continue
+            name = _font_name(entry)
+            if name in reserved:
+                _LOGGER.warning(f"Skipping font {entry}: {name} is a built-in font name")
+                continue
+            path = os.path.join(directory, entry)
+            try:
+                font = load_font(path)
+            except Exception as e:
+                _LOGGER.error(f"Failed to load bitmap font {path}: {e}")
+                continue
+            old = _FONTS.get(name)
+            if old is None or bytes(old._buf[:_HEADER.size]) != bytes(font._buf[:_HEADER.size]):
+                _FONTS[name] = font
+                changed.append(name)
+    return changed
+
+
+def get_bitmap_font(name: str) -> Optional[BitmapFont]:
+    return _FONTS.get(name)
+
+
+def font_names() -> Tuple[str, ...]:
+    return tuple(sorted(_FONTS))
@@ -2,13 +2,39 @@ import asyncio
 import struct
 import time
 from io import BytesIO
-from typing import Optional, Dict, Tuple
+from typing import Any, Optional, Dict, Tuple
 from bleak import BleakClient
 from bleak_retry_connector import establish_connection
-from homeassistant.components import bluetooth
 from homeassistant.core import HomeAssistant
 from PIL import Image
-from .const import IDM_CHAR_WRITE
+from .ble_scheduler import async_get_scheduler
+from .const import DATA_CLIENTS, IDM_CHAR_WRITE
+from .renderer import encode_frame
+
+_FRAME = "frame"
+# Static panels give their connection slot back after this much idle time
+IDLE_DISCONNECT_SECONDS = 20.0
+# Delays between attempts to put the last frame back after the link dropped
+RESTORE_BACKOFF = (0.5, 2.0, 5.0, 15.0)
+
+
+def async_get_client(hass: HomeAssistant, mac: str, width: int, height: int) -> "UmpBleClient":
+    # One client (and so one connection and command queue) per MAC address
+    clients: Dict[str, UmpBleClient] = hass.data.setdefault(DATA_CLIENTS, {})
+    client = clients.get(mac)
+    if client is None:
+        client = clients[mac] = UmpBleClient(hass, mac, width, height)
+    return client
+
+
+class _Command:
+    __slots__ = ("value", "payload", "waiters")
+
+    def __init__(self, value: Any, payload: Any, waiter: asyncio.Future) -> None:
+        self.value = value
+        self.payload = payload
+        self.waiters = [waiter]
+
 
 class UmpBleClient:
     def __init__(self, hass: HomeAssistant, mac: str, width: int, height: int) -> None:
@@ -19,29 +45,51 @@ class UmpBleClient:
         self._client: Optional[BleakClient] = None
         self._lock = asyncio.Lock()
         self._last_image_bytes: Optional[bytes] = None
+        # Last known device state per command key ("power", "mode", "brightness",
+        # "frame"); missing means unknown, e.g. after a reconnect.
+        self._shadow: Dict[str, Any] = {}
+        # Queued commands, one per key, oldest first; a newer request for the
+        # same key replaces the queued value (latest wins).
+        self._pending: Dict[str, _Command] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self._scheduler = async_get_scheduler(hass)
+        # Animated panels keep their connection; static ones connect on demand
+        self._persistent = False
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self._restore_task: Optional[asyncio.Task] = None
+        self._blank_image_bytes: Optional[bytes] = None
         self._init_default_image()
 
     def _init_default_image(self):
+        # Shown by the camera until the first frame is drawn or restored
         try:
             img = Image.new('RGB', (self._width, self._height), color='black')
             img_byte_arr = BytesIO()
             img.save(img_byte_arr, format='PNG')
-            self._last_image_bytes = img_byte_arr.getvalue()
+            self._blank_image_bytes = img_byte_arr.getvalue()
         except Exception:
             pass
 
     def get_last_frame(self) -> bytes | None:
+        return self._last_image_bytes or self._blank_image_bytes
+
+    @property
+    def last_payload(self) -> Optional[bytes]:
+        # Encoded PNG of the last frame drawn, None if nothing was drawn yet
         return self._last_image_bytes
 
+    def shows_frame(self, png_data: bytes) -> bool:
+        # On the panel, or being written to it right now
+        return self._shadow.get(_FRAME) == png_data
+
     async def ensure_connected(self) -> None:
         if self._client and self._client.is_connected:
             return
         async with self._lock:
             if self._client and self._client.is_connected:
                 return
-            device = bluetooth.async_ble_device_from_address(self._hass, self._mac, connectable=True)
-            if device is None:
-                raise ConnectionError(f"UMP {self._mac} not available")
+            # The scheduler picks the adapter/proxy and may evict an idle panel
+            device = await self._scheduler.acquire(self._mac, self._persistent, self.disconnect)
             try:
                 self._client = await establish_connection(
                     BleakClient,
@@ -50,10 +98,136 @@ class UmpBleClient:
                     disconnected_callback=self._on_disconnect,
                 )
             except Exception as e:
+                self._scheduler.release(self._mac)
                 raise ConnectionError(f"Failed to connect to UMP {self._mac}") from e
+            self._scheduler.connected(self._mac, self._client)
+
+    def set_persistent(self, persistent: bool) -> None:
+        self._persistent = persistent
+        self._scheduler.touch(self._mac, persistent)
+        if persistent:
+            self._cancel_idle()
+        elif not self._pending:
+            self._schedule_idle()
+
+    def _cancel_idle(self) -> None:
+        if self._idle_handle:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _schedule_idle(self) -> None:
+        self._cancel_idle()
+        if self._client:
+            self._idle_handle = self._hass.loop.call_later(
+                IDLE_DISCONNECT_SECONDS, lambda: self._hass.async_create_task(self.disconnect())
+            )
 
     def _on_disconnect(self, client: BleakClient) -> None:
+        if self._client is not None and client is not self._client:
+            return  # late callback for a link that was already replaced
+        lost = self._client is not None
         self._client = None
+        self._shadow.clear()
+        self._scheduler.release(self._mac)
+        if lost:
+            # Dropped under us (proxy blip, panel power cycle), not by
+            # disconnect(): put the last frame back as soon as we can
+            self.restore_frame()
+
+    def restore_frame(self, png_data: Optional[bytes] = None) -> None:
+        # Re-send an already encoded frame (the last one drawn, or one loaded
+        # from storage at startup) without rendering anything
+        if png_data is not None:
+            self._last_image_bytes = png_data
+        if self._last_image_bytes is None: return
+        if self._restore_task and not self._restore_task.done():
+            self._restore_task.cancel()
+        self._restore_task = self._hass.async_create_task(self._restore(self._last_image_bytes))
+
+    async def _restore(self, png_data: bytes) -> None:
+        for delay in RESTORE_BACKOFF:
+            await asyncio.sleep(delay)
+            # A newer frame went out (or is queued) meanwhile
+            if self._last_image_bytes is not png_data or self._shadow.get(_FRAME) == png_data:
+                return
+            if _FRAME in self._pending:
+                return
+            try:
+                await self._submit(_FRAME, png_data, png_data)
+                return
+            except Exception:
+                continue
+
+    async def disconnect(self) -> None:
+        self._cancel_idle()
+        if self._restore_task:
+            self._restore_task.cancel()
+            self._restore_task = None
+        client, self._client = self._client, None
+        self._shadow.clear()
+        self._scheduler.release(self._mac)
+        if client:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    def _submit(self, key: str, value: Any, payload: Any) -> asyncio.Future:
+        waiter = self._hass.loop.create_future()
+        cmd = self._pending.get(key)
+        if cmd is not None:
+            cmd.value = value
+            cmd.payload = payload
+            cmd.waiters.append(waiter)
+            if value is not None and self._shadow.get(key) == value:
+                # The queued change got reverted before it went out
+                del self._pending[key]
+                for w in cmd.waiters: w.set_result(None)
+        elif value is not None and self._shadow.get(key) == value:
+            waiter.set_result(None)
+            return waiter
+        else:
+            self._pending[key] = _Command(value, payload, waiter)
+
+        self._cancel_idle()
+        if self._worker is None or self._worker.done():
+            self._worker = self._hass.async_create_task(self._drain())
+        return waiter
+
+    async def _drain(self) -> None:
+        while self._pending:
+            key = next(iter(self._pending))
+            cmd = self._pending.pop(key)
+            # Shadow is updated before the write so requests arriving meanwhile
+            # compare against the state the device is about to be in
+            if cmd.value is not None:
+                self._shadow[key] = cmd.value
+            try:
+                await self.ensure_connected()
+            except Exception as e:
+                # No link: fail everything queued instead of reconnecting per command
+                failed = [cmd] + list(self._pending.values())
+                self._pending.clear()
+                self._shadow.pop(key, None)
+                for c in failed:
+                    for w in c.waiters:
+                        if not w.done(): w.set_exception(e)
+                continue
+            try:
+                if key == _FRAME:
+                    await self._write_frame(cmd.payload)
+                else:
+                    await self.write_gatt(cmd.payload)
+            except Exception as e:
+                self._shadow.pop(key, None)
+                for w in cmd.waiters:
+                    if not w.done(): w.set_exception(e)
+            else:
+                self._scheduler.touch(self._mac)
+                for w in cmd.waiters:
+                    if not w.done(): w.set_result(None)
+        if not self._persistent:
+            self._schedule_idle()
 
     async def write_gatt(self, data: bytes, response: bool = False) -> None:
         await self.ensure_connected()
@@ -71,11 +245,16 @@ class UmpBleClient:
     async def set_state(self, on: bool) -> None:
         val = 1 if on else 0
         cmd = bytearray([0x06, 0x00, 0x04, 0x00, 0x01, 0x00, val])
-        await self.write_gatt(cmd)
+        await self._submit("power", on, cmd)
 
     async def set_mode(self, mode: int) -> None:
         cmd = bytearray([0x06, 0x00, 0x03, 0x00, 0x01, 0x00, mode])
-        await self.write_gatt(cmd)
+        await self._submit("mode", mode, cmd)
+
+    async def set_brightness(self, percent: int) -> None:
+        percent = max(5, min(100, int(percent)))
+        cmd = bytearray([0x05, 0x00, 0x04, 0x80, percent])
+        await self._submit("brightness", percent, cmd)
 
     async def clear(self) -> None:
         img = Image.new('RGB', (self._width, self._height), color='black')
@@ -91,7 +270,7 @@ class UmpBleClient:
             now.tm_hour, now.tm_min, now.tm_sec, 
             now.tm_wday + 1
         ])
-        await self.write_gatt(cmd)
+        await self._submit("time", None, cmd)
 
     @staticmethod
     def _create_image_payloads(png_data: bytes) -> bytearray:
@@ -106,24 +285,25 @@ class UmpBleClient:
         return payloads
 
     async def send_frame_png(self, img: Image.Image) -> None:
-        if img.size != (self._width, self._height):
-            img = img.resize((self._width, self._height), Image.Resampling.NEAREST)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        png_data = img_byte_arr.getvalue()
-        
+        await self.submit_png(encode_frame(img, self._width, self._height))
+
+    def submit_png(self, png_data: bytes) -> asyncio.Future:
+        # Queue an already encoded frame without waiting for the write.
+        # Identical frames are dropped, queued ones replaced by the newest.
         self._last_image_bytes = png_data
-        
+        return self._submit(_FRAME, png_data, png_data)
+
+    async def _write_frame(self, png_data: bytes) -> None:
         payloads = self._create_image_payloads(png_data)
         chunks = [payloads[i:i + 512] for i in range(0, len(payloads), 512)]
         await self.ensure_connected()
         init_data = bytearray([10, 0, 5, 1, 0, 0, 0, 0, 0, 0])
         await self._client.write_gatt_char(IDM_CHAR_WRITE, bytes(init_data), response=True)
         await asyncio.sleep(0.05)
+        start = time.monotonic()
         for chunk in chunks:
             await self._client.write_gatt_char(IDM_CHAR_WRITE, bytes(chunk), response=False) 
+        self._scheduler.record_throughput(self._mac, len(payloads), time.monotonic() - start)
 
     async def send_frame_dict(self, pixels: Dict[Tuple[int, int], Tuple[int, int, int]]) -> None:
         img = Image.new('RGB', (self._width, self._height), color='black')
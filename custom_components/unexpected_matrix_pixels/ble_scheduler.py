@@ -0,0 +1,178 @@
+from __future__ import annotations
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from homeassistant.components import bluetooth
+from homeassistant.core import HomeAssistant
+from .const import DATA_SCHEDULER
+
+_LOGGER = logging.getLogger(__name__)
+
+# Used when a scanner does not report its connection slots: ESPHome proxies
+# default to 3 concurrent connections, local adapters are not much better.
+DEFAULT_SLOTS_PER_SOURCE = 3
+# Score weights: dBm of RSSI, points per kB/s of measured write throughput
+# (capped), and a penalty per slot already taken on the source.
+THROUGHPUT_WEIGHT = 1.0
+THROUGHPUT_CAP = 20.0
+LOAD_PENALTY = 5.0
+THROUGHPUT_SMOOTHING = 0.3
+
+# (source, ble_device, rssi)
+Candidate = Tuple[str, Any, int]
+EvictCallback = Callable[[], Awaitable[None]]
+
+
+class HassBluetoothManager:
+    # Adapter over Home Assistant's bluetooth API; tests can pass any object
+    # with the same four methods instead.
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+
+    def candidates(self, address: str) -> List[Candidate]:
+        return [
+            (dev.scanner.source, dev.ble_device, dev.advertisement.rssi)
+            for dev in bluetooth.async_scanner_devices_by_address(self._hass, address, connectable=True)
+        ]
+
+    def _allocations(self) -> Dict[str, Any]:
+        # Slot allocations per source, for scanners that report them
+        current = getattr(bluetooth, "async_current_scanners", None)
+        if current is None: return {}
+        allocations = {}
+        for scanner in current(self._hass):
+            get_allocations = getattr(scanner, "get_allocations", None)
+            allocation = get_allocations() if get_allocations else None
+            if allocation is not None:
+                allocations[scanner.source] = allocation
+        return allocations
+
+    def slots(self, source: str) -> int:
+        allocation = self._allocations().get(source)
+        return allocation.slots if allocation else DEFAULT_SLOTS_PER_SOURCE
+
+    def allocated(self, source: str) -> Optional[List[str]]:
+        # Addresses connected through `source` by any integration, None if unknown
+        allocation = self._allocations().get(source)
+        return [address.upper() for address in allocation.allocated] if allocation else None
+
+    def connected_source(self, address: str, client: Any) -> Optional[str]:
+        # Home Assistant's BleakClient wrapper only keeps the address of the
+        # device it is given and connects through whichever scanner it likes
+        for source, allocation in self._allocations().items():
+            if address.upper() in (a.upper() for a in allocation.allocated):
+                return source
+        backend = getattr(client, "_backend", None)
+        return getattr(backend, "_source", None)
+
+
+class _Slot:
+    __slots__ = ("source", "persistent", "evict")
+
+    def __init__(self, source: str, persistent: bool, evict: EvictCallback) -> None:
+        self.source = source
+        self.persistent = persistent
+        self.evict = evict
+
+
+class ConnectionScheduler:
+    # Shared by all panels: picks the adapter/proxy each panel connects
+    # through and keeps an LRU pool of the connection slots in use.
+    def __init__(self, manager: Any) -> None:
+        self._manager = manager
+        self._slots: "OrderedDict[str, _Slot]" = OrderedDict()
+        self._throughput: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def _in_use(self, source: str) -> int:
+        # Ours plus links other integrations hold on the same source
+        ours = sum(1 for slot in self._slots.values() if slot.source == source)
+        allocated = self._manager.allocated(source)
+        if allocated is None: return ours
+        mine = {mac.upper() for mac in self._slots}
+        return ours + sum(1 for address in allocated if address not in mine)
+
+    def _score(self, source: str, rssi: int) -> float:
+        kbps = self._throughput.get(source, 0.0) / 1000
+        return rssi + THROUGHPUT_WEIGHT * min(kbps, THROUGHPUT_CAP) - LOAD_PENALTY * self._in_use(source)
+
+    def _pick_victim(self, sources: List[str]) -> Optional[str]:
+        # Least recently used on-demand (static) panel; animated panels keep
+        # their slots until they stop animating
+        for mac, slot in self._slots.items():
+            if slot.source in sources and not slot.persistent:
+                return mac
+        return None
+
+    async def acquire(self, mac: str, persistent: bool, evict: EvictCallback) -> Any:
+        async with self._lock:
+            return await self._acquire(mac, persistent, evict)
+
+    async def _acquire(self, mac: str, persistent: bool, evict: EvictCallback) -> Any:
+        candidates = self._manager.candidates(mac)
+        if not candidates:
+            raise ConnectionError(f"UMP {mac} not available")
+
+        held = self._slots.pop(mac, None)
+        free = [
+            (self._score(source, rssi), source, device)
+            for source, device, rssi in candidates
+            if self._in_use(source) < self._manager.slots(source)
+        ]
+        if free:
+            _, source, device = max(free, key=lambda item: item[0])
+        else:
+            victim = self._pick_victim([c[0] for c in candidates])
+            if victim is None:
+                if held: self._slots[mac] = held
+                raise ConnectionError(f"No free BLE connection slot for UMP {mac}")
+            victim_slot = self._slots.pop(victim)
+            _LOGGER.debug(f"Evicting UMP {victim} from {victim_slot.source} for {mac}")
+            await victim_slot.evict()
+            source = victim_slot.source
+            device = next(c[1] for c in candidates if c[0] == source)
+
+        self._slots[mac] = _Slot(source, persistent, evict)
+        return device
+
+    def connected(self, mac: str, client: Any) -> None:
+        # The chosen source is only a hint: move the slot (and future
+        # throughput samples) to the source the link actually went through
+        slot = self._slots.get(mac)
+        if slot is None: return
+        try:
+            source = self._manager.connected_source(mac, client)
+        except Exception as e:
+            _LOGGER.debug(f"Could not tell which source UMP {mac} connected through: {e}")
+            return
+        if source and source != slot.source:
+            _LOGGER.debug(f"UMP {mac} connected through {source} instead of {slot.source}")
+            slot.source = source
+
+    def touch(self, mac: str, persistent: Optional[bool] = None) -> None:
+        slot = self._slots.get(mac)
+        if slot is None: return
+        if persistent is not None: slot.persistent = persistent
+        self._slots.move_to_end(mac)
+
+    def release(self, mac: str) -> None:
+        self._slots.pop(mac, None)
+
+    def record_throughput(self, mac: str, nbytes: int, seconds: float) -> None:
+        slot = self._slots.get(mac)
+        if slot is None or seconds <= 0: return
+        rate = nbytes / seconds
+        old = self._throughput.get(slot.source)
+        self._throughput[slot.source] = rate if old is None else old + THROUGHPUT_SMOOTHING * (rate - old)
+
+    def source_of(self, mac: str) -> Optional[str]:
+        slot = self._slots.get(mac)
+        return slot.source if slot else None
+
+
+def async_get_scheduler(hass: HomeAssistant) -> ConnectionScheduler:
+    scheduler = hass.data.get(DATA_SCHEDULER)
+    if scheduler is None:
+        scheduler = hass.data[DATA_SCHEDULER] = ConnectionScheduler(HassBluetoothManager(hass))
+    return scheduler
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# One byte-budgeted LRU shared by every render cache of the process (glyphs,
+# text layouts, icon fonts and sprites, decoded images, encoded frames), so
+# templates that keep producing new keys cannot grow memory without bound.
+# Costs are estimates of the memory an entry keeps alive.
+
+DEFAULT_BUDGET = 32 * 2**20
+# Entries bigger than this share of the budget are not cached at all
+MAX_ENTRY_SHARE = 8
+# Rough fixed cost of a Python object graph entry
+ENTRY_OVERHEAD = 200
+
+_MISSING = object()
+
+
+def image_cost(img: Any) -> int:
+    # Pillow keeps at least a byte per band per pixel, mode "1" included
+    if img is None: return ENTRY_OVERHEAD
+    return img.width * img.height * len(img.getbands()) + ENTRY_OVERHEAD
+
+
+class CacheManager:
+    def __init__(self, budget: int = DEFAULT_BUDGET) -> None:
+        self._budget = budget
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        # region -> [hits, misses, evictions, bytes, entries]
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    def set_budget(self, budget: int) -> None:
+        with self._lock:
+            self._budget = max(0, int(budget))
+            self._evict()
+
+    def _region(self, region: str) -> list:
+        stats = self._stats.get(region)
+        if stats is None:
+            stats = self._stats[region] = [0, 0, 0, 0, 0]
+        return stats
+
+    def get(self, region: str, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get((region, key), _MISSING)
+            stats = self._region(region)
+            if entry is _MISSING:
+                stats[1] += 1
+                return default
+            stats[0] += 1
+            self._entries.move_to_end((region, key))
+            return entry[0]
+
+    def put(self, region: str, key: Hashable, value: Any, cost: int) -> Any:
+        cost = max(1, int(cost))
+        with self._lock:
+            self._discard((region, key))
+            if cost * MAX_ENTRY_SHARE > self._budget:
+                return value
+            self._entries[(region, key)] = (value, cost)
+            self._bytes += cost
+            stats = self._region(region)
+            stats[3] += cost
+            stats[4] += 1
+            self._evict()
+        return value
+
+    def _discard(self, full_key: Tuple[str, Hashable]) -> None:
+        entry = self._entries.pop(full_key, None)
+        if entry is None: return
+        self._bytes -= entry[1]
+        stats = self._region(full_key[0])
+        stats[3] -= entry[1]
+        stats[4] -= 1
+
+    def _evict(self) -> None:
+        while self._bytes > self._budget and self._entries:
+            full_key = next(iter(self._entries))
+            self._discard(full_key)
+            self._region(full_key[0])[2] += 1
+
+    def clear(self, region: Optional[str] = None) -> None:
+        with self._lock:
+            for full_key in [k for k in self._entries if region is None or k[0] == region]:
+                self._discard(full_key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget": self._budget,
+                "bytes": self._bytes,
+                "entries": len(self._entries),
+                "regions": {
+                    region: {"hits": s[0], "misses": s[1], "evictions": s[2], "bytes": s[3], "entries": s[4]}
+                    for region, s in sorted(self._stats.items())
+                },
+            }
+
+    def memoize(self, region: str, cost: Callable[[Any], int]) -> Callable:
+        # functools.lru_cache look-alike (positional, hashable arguments)
+        def decorator(func: Callable) -> Callable:
+            name = func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = (name, args)
+                value = self.get(region, key, _MISSING)
+                if value is _MISSING:
+                    value = func(*args)
+                    self.put(region, key, value, cost(value))
+                return value
+
+            wrapper.cache_clear = lambda: self.clear(region)
+            return wrapper
+        return decorator
+
+
+CACHE = CacheManager()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# Frame compositing on one premultiplied-alpha float buffer per display.
+# Elements are converted once, at compile time, into either a coverage mask
+# (text, drawn in one color) or a premultiplied layer (sprites, images); a
+# frame then only blends each element's own bounding box into the buffer,
+# in place, and converts the buffer to RGB once at the end.
+
+# (coverage HxWx1 in 0..1, x offset, y offset)
+Mask = Tuple[np.ndarray, int, int]
+# (premultiplied RGBA HxWx4 in 0..255, 1 - alpha HxWx1)
+Layer = Tuple[np.ndarray, np.ndarray]
+
+EMPTY_MASK: Mask = (np.zeros((0, 0, 1), np.float32), 0, 0)
+
+
+def glyph_mask(glyphs: tuple) -> Mask:
+    # One mask for a whole run of (glyph mask, dx, dy), overlaps merged by max
+    if not glyphs: return EMPTY_MASK
+    x0 = min(dx for _, dx, _ in glyphs)
+    y0 = min(dy for _, _, dy in glyphs)
+    x1 = max(dx + mask.width for mask, dx, _ in glyphs)
+    y1 = max(dy + mask.height for mask, _, dy in glyphs)
+    coverage = np.zeros((y1 - y0, x1 - x0), np.float32)
+    for mask, dx, dy in glyphs:
+        if mask.width == 0 or mask.height == 0: continue
+        alpha = np.asarray(mask, np.float32)
+        if mask.mode != "1": alpha /= 255
+        box = coverage[dy - y0:dy - y0 + mask.height, dx - x0:dx - x0 + mask.width]
+        np.maximum(box, alpha, out=box)
+    return coverage[..., None], x0, y0
+
+
+def image_layer(img: Image.Image) -> Layer:
+    if img.mode != "RGBA": img = img.convert("RGBA")
+    premultiplied = np.asarray(img, np.float32).copy()
+    alpha = premultiplied[..., 3:4] / 255
+    premultiplied[..., :3] *= alpha
+    return premultiplied, 1 - alpha
+
+
+def layer_cost(layer: Layer) -> int:
+    return layer[0].nbytes + layer[1].nbytes
+
+
+class Compositor:
+    # Not thread safe: the owner serialises frames
+    def __init__(self, width: int, height: int) -> None:
+        self._width = width
+        self._height = height
+        self._buf = np.zeros((height, width, 4), np.float32)
+        self._scratch = np.empty((height, width, 4), np.float32)
+        self._rgb = np.empty((height, width, 3), np.uint8)
+
+    def _clip(self, x: int, y: int, width: int, height: int) -> Optional[tuple]:
+        # (canvas box, source box) of the visible part, or None
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self._width), min(y + height, self._height)
+        if x1 <= x0 or y1 <= y0: return None
+        return (slice(y0, y1), slice(x0, x1)), (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+
+    def clear(self, color: tuple) -> None:
+        r, g, b, a = color
+        self._buf[...] = (r * a / 255, g * a / 255, b * a / 255, a)
+
+    def fill(self, mask: Mask, x: int, y: int, color: tuple) -> None:
+        # Source-over of `color` through the coverage mask:
+        # dst += coverage * alpha * (color - dst), premultiplied
+        coverage, dx, dy = mask
+        clip = self._clip(x + dx, y + dy, coverage.shape[1], coverage.shape[0])
+        if clip is None: return
+        dst, src = clip
+        region = self._buf[dst]
+        tmp = self._scratch[:region.shape[0], :region.shape[1]]
+        r, g, b, a = color
+        np.subtract((r, g, b, 255), region, out=tmp)
+        np.multiply(tmp, coverage[src], out=tmp)
+        if a != 255: np.multiply(tmp, a / 255, out=tmp)
+        np.add(region, tmp, out=region)
+
+    def blend(self, layer: Layer, x: int, y: int) -> None:
+        # Source-over of a premultiplied layer: dst = src + dst * (1 - alpha)
+        premultiplied, transparency = layer
+        clip = self._clip(x, y, premultiplied.shape[1], premultiplied.shape[0])
+        if clip is None: return
+        dst, src = clip
+        region = self._buf[dst]
+        np.multiply(region, transparency[src], out=region)
+        np.add(region, premultiplied[src], out=region)
+
+    def to_image(self) -> Image.Image:
+        # Premultiplied RGB is the colour over black, which is what the panel
+        # shows; rounded and narrowed to bytes in a single pass
+        np.add(self._buf[..., :3], 0.5, out=self._rgb, casting="unsafe")
+        return Image.frombytes("RGB", (self._width, self._height), self._rgb)
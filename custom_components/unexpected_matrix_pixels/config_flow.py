@@ -1,14 +1,23 @@
 from __future__ import annotations
 import voluptuous as vol
 from homeassistant import config_entries
+from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.components.bluetooth import BluetoothServiceInfoBleak
-from .const import DOMAIN, CONF_MAC_ADDRESS, CONF_WIDTH, CONF_HEIGHT, DEFAULT_WIDTH, DEFAULT_HEIGHT
+from .const import (
+    DOMAIN, CONF_MAC_ADDRESS, CONF_WIDTH, CONF_HEIGHT, CONF_RENDER_WORKERS,
+    CONF_CACHE_MB, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_RENDER_WORKERS, DEFAULT_CACHE_MB,
+)
 
 class UMPConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> config_entries.OptionsFlow:
+        return UMPOptionsFlow()
+
     async def async_step_bluetooth(self, discovery_info: BluetoothServiceInfoBleak) -> FlowResult:
         await self.async_set_unique_id(discovery_info.address)
         self._abort_if_unique_id_configured()
@@ -46,3 +55,20 @@ class UMPConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 CONF_HEIGHT: height
             }
         )
+
+
+class UMPOptionsFlow(config_entries.OptionsFlow):
+    async def async_step_init(self, user_input=None) -> FlowResult:
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+        workers = self.config_entry.options.get(CONF_RENDER_WORKERS, DEFAULT_RENDER_WORKERS)
+        cache_mb = self.config_entry.options.get(CONF_CACHE_MB, DEFAULT_CACHE_MB)
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema({
+                # 0 renders in Home Assistant's own process
+                vol.Optional(CONF_RENDER_WORKERS, default=workers): vol.All(vol.Coerce(int), vol.Range(min=0, max=8)),
+                # Shared by glyphs, icons, images and frames of every display
+                vol.Optional(CONF_CACHE_MB, default=cache_mb): vol.All(vol.Coerce(int), vol.Range(min=1, max=1024)),
+            }),
+        )
@@ -2,7 +2,15 @@ DOMAIN = "unexpected_matrix_pixels"
 CONF_MAC_ADDRESS = "mac_address"
 CONF_WIDTH = "width"
 CONF_HEIGHT = "height"
+CONF_RENDER_WORKERS = "render_workers"
+CONF_CACHE_MB = "cache_mb"
 DEFAULT_WIDTH = 32
 DEFAULT_HEIGHT = 32
+DEFAULT_RENDER_WORKERS = 0
+DEFAULT_CACHE_MB = 32
 IDM_SERVICE_UUID = "000000fa-0000-1000-8000-00805f9b34fb"
 IDM_CHAR_WRITE = "0000fa02-0000-1000-8000-00805f9b34fb"
+DATA_CLIENTS = f"{DOMAIN}_clients"
+DATA_SCHEDULER = f"{DOMAIN}_scheduler"
+DATA_CLOCK = f"{DOMAIN}_clock"
+STORAGE_VERSION = 1
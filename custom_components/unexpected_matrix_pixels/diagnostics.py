@@ -0,0 +1,13 @@
+from __future__ import annotations
+from typing import Any, Dict
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .cache import CACHE
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    # Render cache is process wide: the same numbers for every entry
+    return {
+        "options": dict(entry.options),
+        "render_cache": CACHE.stats(),
+    }
@@ -3,33 +3,30 @@ import logging
 import voluptuous as vol
 import os
 import asyncio
+import base64
 import time
-import json
 import aiohttp
-from io import BytesIO
 from typing import Any, List, Dict, Optional, Tuple
-from homeassistant.components.light import ColorMode, LightEntity
+from homeassistant.components.light import ATTR_BRIGHTNESS, ColorMode, LightEntity
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
-from PIL import Image, ImageDraw, ImageFont
-from .const import DOMAIN, CONF_MAC_ADDRESS, CONF_WIDTH, CONF_HEIGHT, DEFAULT_WIDTH, DEFAULT_HEIGHT
-from .ble_client import UmpBleClient
-from .fonts import FONT_3X5_DATA, FONT_5X7_DATA, AWTRIX_BITMAPS, AWTRIX_GLYPHS
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+from PIL import Image
+from .const import DOMAIN, CONF_MAC_ADDRESS, CONF_WIDTH, CONF_HEIGHT, DEFAULT_WIDTH, DEFAULT_HEIGHT, STORAGE_VERSION
+from .animation import async_get_clock
+from .ble_client import UmpBleClient, async_get_client
+from .cache import CACHE, ENTRY_OVERHEAD
+from .renderer import MAX_IMAGE_BYTES, SceneRenderer, decode_image, encode_frame
+from .scene import Scene, digest, valid_color, valid_element
 
 _LOGGER = logging.getLogger(__name__)
 
-REPLACE_CHARS = {
-    'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
-    'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z'
-}
-
-def sanitize_text(text: str) -> str:
-    for pl, en in REPLACE_CHARS.items():
-        text = text.replace(pl, en)
-    return text
+# Scene stack and last frame are written at most this often (and on shutdown)
+SAVE_DELAY = 10
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
     mac = entry.data[CONF_MAC_ADDRESS]
@@ -38,16 +35,18 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
     if DOMAIN in hass.data and entry.entry_id in hass.data[DOMAIN]:
         client = hass.data[DOMAIN][entry.entry_id]["client"]
     else:
-        client = UmpBleClient(hass, mac, width, height)
+        client = async_get_client(hass, mac, width, height)
     display = IDMDisplayEntity(client, mac, entry.title, hass, width, height)
     async_add_entities([display])
     platform = entity_platform.async_get_current_platform()
     platform.async_register_entity_service(
         "draw_visuals",
         {
-            vol.Required("elements"): list,
-            vol.Optional("background", default=[0, 0, 0]): list,
-            vol.Optional("fps", default=10): int,  
+            vol.Required("elements"): vol.All(list, [valid_element]),
+            vol.Optional("background", default=[0, 0, 0]): valid_color,
+            vol.Optional("fps", default=10): vol.All(vol.Coerce(int), vol.Clamp(min=1, max=30)),
+            vol.Optional("priority", default=0): vol.Coerce(int),
+            vol.Optional("ttl"): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
         },
         "async_draw_visuals"
     )
@@ -62,34 +61,30 @@ class IDMDisplayEntity(LightEntity):
         self._height = height
         self._attr_name = name
         self._attr_unique_id = mac
-        self._attr_supported_color_modes = {ColorMode.ONOFF}
-        self._attr_color_mode = ColorMode.ONOFF
+        self._attr_supported_color_modes = {ColorMode.BRIGHTNESS}
+        self._attr_color_mode = ColorMode.BRIGHTNESS
+        self._attr_brightness = 255
         self._is_on = True
         self._hass = hass
-        self._anim_task = None 
-        self._font_path = os.path.join(os.path.dirname(__file__), 'materialdesignicons-webfont.ttf')
-        self._meta_path = os.path.join(os.path.dirname(__file__), 'materialdesignicons-webfont_meta.json')
-        self._mdi_map = {} 
-        self._mdi_fonts = {} 
-        self._mdi_ready = False
-        
-        # --- CACHE (MEMOIZATION) ---
-        self._char_mask_cache: Dict[Tuple[str, str], Tuple[Optional[Image.Image], int]] = {}
-        
-        self._hass.async_create_task(self._init_mdi())
-
-    async def _init_mdi(self):
-        if not os.path.exists(self._meta_path) or not os.path.exists(self._font_path):
-            return
-        try:
-            def load_meta():
-                with open(self._meta_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            mdi_data = await self._hass.async_add_executor_job(load_meta)
-            self._mdi_map = {item['name']: item['codepoint'] for item in mdi_data}
-            self._mdi_ready = True
-        except Exception:
-            pass
+        # Animated scenes are rendered by the integration-wide clock
+        self._clock = async_get_clock(hass)
+        # Priority stack of scenes, lowest first; the last one is on screen
+        self._scenes: List[Scene] = []
+        self._renderer = SceneRenderer(width, height)
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{mac.replace(':', '').lower()}")
+        self._restore_task = None
+
+    async def async_added_to_hass(self) -> None:
+        # Background: fetching a stored scene's images must not hold up startup
+        self._restore_task = self._hass.async_create_background_task(
+            self._async_restore(), f"{DOMAIN} restore {self._mac}")
+
+    async def async_will_remove_from_hass(self) -> None:
+        if self._restore_task: self._restore_task.cancel()
+        self._clock.stop(self)
+        for scene in self._scenes:
+            if scene.expire_unsub: scene.expire_unsub()
+        self._scenes.clear()
 
     @property
     def is_on(self) -> bool:
@@ -100,26 +95,39 @@ class IDMDisplayEntity(LightEntity):
         try:
             await self._client.set_state(True)
             await self._client.set_mode(0)
+            if ATTR_BRIGHTNESS in kwargs:
+                self._attr_brightness = kwargs[ATTR_BRIGHTNESS]
+                await self._client.set_brightness(round(self._attr_brightness * 100 / 255))
         except Exception as e:
             _LOGGER.warning(f"UMP device unavailable during turn_on: {e}")
         self.async_write_ha_state()
+        self._save_state()
+        if self._scenes:
+            await self._show_scene(self._scenes[-1])
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        if self._anim_task: self._anim_task.cancel()
+        self._clock.stop(self)
+        self._client.set_persistent(False)
         self._is_on = False
         try:
             await self._client.set_state(False)
         except Exception as e:
             _LOGGER.warning(f"UMP device unavailable during turn_off: {e}")
         self.async_write_ha_state()
+        self._save_state()
 
     async def async_clear_display(self, **kwargs: Any) -> None:
-        if self._anim_task: self._anim_task.cancel()
+        self._clock.stop(self)
+        for scene in self._scenes:
+            if scene.expire_unsub: scene.expire_unsub()
+        self._scenes.clear()
+        self._client.set_persistent(False)
         try:
             await self._client.set_mode(0)
             await self._client.clear()
         except Exception as e:
             _LOGGER.warning(f"UMP device unavailable during clear_display: {e}")
+        self._save_state()
 
     async def async_sync_time(self, **kwargs: Any) -> None:
         try:
@@ -127,25 +135,24 @@ class IDMDisplayEntity(LightEntity):
         except Exception as e:
             _LOGGER.warning(f"UMP device unavailable during sync_time: {e}")
 
-    async def async_draw_visuals(self, elements: list, background: list, fps: int = 10) -> None:
-        # Pre-process elements first to ensure we don't fail later
-        processed_elements = []
-        for el in elements:
-            new_el = el.copy()
-            if new_el.get('type') == 'image':
-                img = await self._fetch_and_process_image(new_el)
-                if img: new_el['_cached_img'] = img
-            
-            if new_el.get('type') == 'textlong':
-                lines = self._get_text_lines(
-                    sanitize_text(str(new_el.get('content', ''))),
-                    new_el.get('font', '5x7'),
-                    int(new_el.get('spacing', 1)),
-                    self._width
-                )
-                new_el['_cached_lines'] = lines
+    async def async_draw_visuals(self, elements: list, background: tuple, fps: int = 10,
+                                 priority: int = 0, ttl: Optional[float] = None) -> None:
+        scene_digest = self._scene_digest(elements, background, fps)
+        current = next((s for s in self._scenes if s.priority == priority), None)
+        if current is not None and current.digest == scene_digest and self._is_on and self._on_panel(current):
+            # Template automations repeat identical calls on every state change:
+            # keep the running scene (and its animation phase), only the ttl
+            # follows the newest call
+            self._arm_ttl(current, ttl)
+            self._save_state()
+            return
 
-            processed_elements.append(new_el)
+        # Elements arrive validated by the service schema; compile them once
+        scene = await self._build_scene(elements, background, fps, priority)
+        # On the stack and saved before any BLE traffic, so a restart or a
+        # reconnect brings back this scene even if the panel is unreachable now
+        self._push_scene(scene, ttl)
+        self._save_state()
 
         # Try setting state/mode first
         try:
@@ -155,395 +162,219 @@ class IDMDisplayEntity(LightEntity):
                 self.async_write_ha_state()
             await self._client.set_mode(0)
         except Exception as e:
-            _LOGGER.warning(f"UMP device unavailable, skipping draw_visuals: {e}")
-            return # Stop processing to avoid further errors
-
-        if self._anim_task and not self._anim_task.done():
-            self._anim_task.cancel()
-            self._anim_task = None
-            
-        # --- LOGIC FIX: DETECT IF ANIMATION IS REALLY NEEDED ---
-        has_animation = False
-        anim_candidates = [el for el in processed_elements if el.get('type') in ['textscroll', 'textlong']]
-        
-        if anim_candidates:
-            for el in anim_candidates:
-                if el.get('type') == 'textscroll':
-                    # Textscroll always implies animation
-                    has_animation = True
-                    break
-                elif el.get('type') == 'textlong':
-                    # Textlong implies animation ONLY if multiple lines exist
-                    lines = el.get('_cached_lines', [])
-                    if len(lines) > 1:
-                        has_animation = True
-                        break
-        
-        if has_animation:
-            self._anim_task = self._hass.async_create_task(self._animate_loop(processed_elements, background, fps))
+            _LOGGER.warning(f"UMP device unavailable during draw_visuals: {e}")
+
+        if self._scenes[-1] is scene:
+            # Even with the link down: a failed frame is replayed once it is back
+            await self._show_scene(scene)
+        self._save_state()
+
+    def _on_panel(self, scene: Scene) -> bool:
+        # A preempted scene is not meant to be visible; the top one must
+        # actually be animating or be the frame the panel shows
+        if self._scenes[-1] is not scene: return True
+        if scene.animated: return self._clock.is_running(self)
+        return self._client.shows_frame(self._static_frame(scene))
+
+    def _push_scene(self, scene: Scene, ttl: Optional[float]) -> None:
+        # A scene replaces whatever was drawn at the same priority
+        for old in [s for s in self._scenes if s.priority == scene.priority]:
+            if old.expire_unsub: old.expire_unsub()
+            self._scenes.remove(old)
+        self._scenes.append(scene)
+        self._scenes.sort(key=lambda s: s.priority)
+        self._arm_ttl(scene, ttl)
+
+    def _arm_ttl(self, scene: Scene, ttl: Optional[float]) -> None:
+        if scene.expire_unsub:
+            scene.expire_unsub()
+            scene.expire_unsub = None
+        scene.expires = None
+        if ttl:
+            scene.expires = time.time() + ttl
+
+            async def _expired(_now) -> None:
+                scene.expire_unsub = None
+                await self._expire_scene(scene)
+            scene.expire_unsub = async_call_later(self._hass, ttl, _expired)
+
+    async def _expire_scene(self, scene: Scene) -> None:
+        if scene not in self._scenes: return
+        was_top = self._scenes[-1] is scene
+        self._scenes.remove(scene)
+        self._save_state()
+        if not was_top or not self._is_on: return
+
+        if self._scenes:
+            # Resume the preempted scene with its already compiled elements
+            await self._show_scene(self._scenes[-1])
         else:
-            # STATIC FRAME LOGIC
-            # Even if static, check if frame changed vs last sent frame to avoid BLE spam
-            canvas = self._render_canvas_sync(processed_elements, background)
-            
-            if canvas.mode != 'RGB':
-                canvas = canvas.convert('RGB')
-            
-            img_byte_arr = BytesIO()
-            canvas.save(img_byte_arr, format='PNG', compress_level=0)
-            new_bytes = img_byte_arr.getvalue()
-            
-            last_bytes = self._client.get_last_frame()
-            
-            if last_bytes != new_bytes:
-                try:
-                    await self._client.send_frame_png(canvas)
-                except Exception as e:
-                    _LOGGER.warning(f"UMP device disconnected while sending frame: {e}")
-
-    async def _animate_loop(self, elements: list, background: list, fps: int):
-        target_frame_time = 1.0 / max(1, min(fps, 30)) 
-        
-        try:
-            while True:
-                loop_start = time.time()
-                
-                canvas = self._render_canvas_sync(elements, background)
-                
-                if canvas.mode != 'RGB':
-                    canvas = canvas.convert('RGB')
-                
-                img_byte_arr = BytesIO()
-                canvas.save(img_byte_arr, format='PNG', compress_level=0)
-                new_bytes = img_byte_arr.getvalue()
-                
-                last_bytes = self._client.get_last_frame()
-                
-                if last_bytes != new_bytes:
-                    try:
-                        await self._client.send_frame_png(canvas)
-                    except Exception as e:
-                        _LOGGER.warning(f"Error sending frame (animation): {e}")
-                        # Wait a bit longer if connection failed before retrying
-                        await asyncio.sleep(5.0)
-                        continue
-
-                elapsed = time.time() - loop_start
-                sleep_time = max(0.01, target_frame_time - elapsed)
-                await asyncio.sleep(sleep_time)
-                
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            _LOGGER.error(f"Animation loop crashed: {e}")
-
-    def _render_canvas_sync(self, elements: list, background: list) -> Image.Image:
-        bg_rgba = tuple(background)
-        if len(bg_rgba) == 3:
-            bg_rgba = bg_rgba + (255,)
-        
-        canvas = Image.new('RGBA', (self._width, self._height), bg_rgba)
-        draw = ImageDraw.Draw(canvas)
-        
-        for el in elements:
+            self._clock.stop(self)
+            self._client.set_persistent(False)
             try:
-                el_type = el.get('type')
-                if el_type == 'text':
-                    self._draw_text_element(canvas, el)
-                elif el_type == 'textscroll':
-                    self._draw_textscroll_element(canvas, draw, el)
-                elif el_type == 'textlong':
-                    self._draw_textlong_element(canvas, el)
-                elif el_type == 'pixels':
-                    self._draw_pixels_element(canvas, el)
-                elif el_type == 'icon':
-                    self._draw_mdi_element(canvas, el)
-                elif el_type == 'image' and '_cached_img' in el:
-                    x, y = int(el.get('x', 0)), int(el.get('y', 0))
-                    img = el['_cached_img']
-                    if img.mode == 'RGBA':
-                         canvas.paste(img, (x, y), img)
-                    else:
-                         canvas.paste(img, (x, y))
+                await self._client.clear()
             except Exception as e:
-                _LOGGER.debug(f"Error rendering element {el}: {e}")
-                pass
-        
-        final_image = Image.new("RGB", canvas.size, (0, 0, 0))
-        final_image.paste(canvas, (0, 0), mask=canvas)
-        return final_image
-
-    def _get_char_mask(self, font_name: str, char: str) -> Tuple[Optional[Image.Image], int]:
-        cache_key = (font_name, char)
-        if cache_key in self._char_mask_cache:
-            return self._char_mask_cache[cache_key]
-
-        img_mask = None
-        advance = 0
-
-        if font_name == 'awtrix':
-            code = ord(char)
-            if 32 <= code <= 126:
-                glyph_idx = code - 32
-                if glyph_idx < len(AWTRIX_GLYPHS):
-                    (bo, w, h, adv, xo, yo) = AWTRIX_GLYPHS[glyph_idx]
-                    advance = adv
-                    if w > 0 and h > 0:
-                        img_mask = Image.new('1', (w, h), 0)
-                        bits = 0
-                        bit_counter = 0
-                        current_bitmap_idx = bo
-                        for yy in range(h):
-                            for xx in range(w):
-                                if (bit_counter & 7) == 0:
-                                    if current_bitmap_idx < len(AWTRIX_BITMAPS):
-                                        bits = AWTRIX_BITMAPS[current_bitmap_idx]
-                                        current_bitmap_idx += 1
-                                    else:
-                                        bits = 0
-                                bit_counter += 1
-                                if bits & 0x80:
-                                    img_mask.putpixel((xx, yy), 1)
-                                bits <<= 1
-            else:
-                advance = 4
-        else:
-            if font_name == '3x5':
-                font_data = FONT_3X5_DATA; char_w = 3; char_h = 5; stride = 3
-            else:
-                font_data = FONT_5X7_DATA; char_w = 5; char_h = 7; stride = 7
-            
-            advance = char_w
-            code = ord(char)
-            if code * stride < len(font_data):
-                img_mask = Image.new('1', (char_w, char_h), 0)
-                offset = code * stride
-                for col in range(char_w):
-                    if col >= stride: break
-                    byte = font_data[offset + col]
-                    for row in range(8):
-                        if row >= char_h: break
-                        if (byte >> row) & 1:
-                            img_mask.putpixel((col, row), 1)
-
-        if img_mask is None:
-            advance = 4 if font_name == 'awtrix' else (3 if font_name == '3x5' else 5)
-
-        self._char_mask_cache[cache_key] = (img_mask, advance)
-        return img_mask, advance
-
-    def _measure_char_width(self, char: str, font_name: str) -> int:
-        _, advance = self._get_char_mask(font_name, char)
-        return advance
-
-    def _measure_text_width(self, text: str, font_name: str, spacing: int) -> int:
-        if not text: return 0
-        width = 0
-        for i, char in enumerate(text):
-            width += self._measure_char_width(char, font_name)
-            if i < len(text) - 1:
-                width += spacing - 1 if font_name == 'awtrix' else spacing
-        return width
-
-    def _get_text_lines(self, text: str, font_name: str, spacing: int, max_width: int) -> List[str]:
-        words = text.split(' ')
-        lines = []
-        current_line = []
-        current_line_width = 0
-        space_width = self._measure_char_width(' ', font_name) 
-        actual_space_px = space_width + (spacing - 1 if font_name == 'awtrix' else spacing)
-
-        for word in words:
-            word_width = self._measure_text_width(word, font_name, spacing)
-            
-            if not current_line:
-                current_line.append(word)
-                current_line_width = word_width
-            else:
-                new_width = current_line_width + actual_space_px + word_width
-                if new_width <= max_width:
-                    current_line.append(word)
-                    current_line_width = new_width
-                else:
-                    lines.append(" ".join(current_line))
-                    current_line = [word]
-                    current_line_width = word_width
-        
-        if current_line:
-            lines.append(" ".join(current_line))
-            
-        return lines
-
-    def _draw_text_element(self, canvas: Image.Image, el: Dict[str, Any]) -> None:
-        content = sanitize_text(str(el.get('content', '')))
-        x, y = int(el.get('x', 0)), int(el.get('y', 0))
-        raw_color = el.get('color', [255, 255, 255])
-        color = tuple(raw_color)
-        if len(color) == 3: color = color + (255,)
-        
-        font_name = el.get('font', '5x7')
-        spacing = int(el.get('spacing', 1))
-        
-        cursor_x = x
-        
-        for char in content:
-            mask, advance = self._get_char_mask(font_name, char)
-            
-            if mask:
-                draw_y = y
-                draw_x = cursor_x
-                
-                if font_name == 'awtrix':
-                    code = ord(char)
-                    if 32 <= code <= 126:
-                        glyph_idx = code - 32
-                        if glyph_idx < len(AWTRIX_GLYPHS):
-                            (_, _, _, _, xo, yo) = AWTRIX_GLYPHS[glyph_idx]
-                            draw_x += xo
-                            draw_y += (5 + yo)
-                
-                try:
-                    canvas.paste(color, (draw_x, draw_y), mask)
-                except Exception:
-                    pass
-            
-            cursor_x += advance + (spacing - 1 if font_name == 'awtrix' else spacing)
-
-    def _draw_textlong_element(self, canvas, el: Dict[str, Any]) -> None:
-        lines = el.get('_cached_lines', [])
-        if not lines: return
-
-        base_x = int(el.get('x', 0))
-        base_y = int(el.get('y', 0))
-        speed = float(el.get('speed', 2.0)) 
-        scroll_duration = float(el.get('scroll_duration', 0.5))
-        direction = el.get('direction', 'up') 
-        
-        font_name = el.get('font', '5x7')
-        if font_name == '3x5': line_h = 6
-        elif font_name == '5x7': line_h = 8
-        else: line_h = 8
-
-        now = time.time()
-        num_lines = len(lines)
-        
-        if num_lines == 1:
-            draw_params = el.copy()
-            draw_params['type'] = 'text'
-            draw_params['content'] = lines[0]
-            self._draw_text_element(canvas, draw_params)
+                _LOGGER.warning(f"UMP device unavailable while clearing expired scene: {e}")
+
+    # --- PERSISTENCE ---
+    # The scene stack (as validated service data) and the last encoded frame
+    # survive restarts; the frame is replayed before anything is re-rendered.
+
+    def _save_state(self) -> None:
+        self._store.async_delay_save(self._state_data, SAVE_DELAY)
+
+    def _state_data(self) -> Dict[str, Any]:
+        frame = self._client.last_payload
+        return {
+            "is_on": self._is_on,
+            "brightness": self._attr_brightness,
+            "scenes": [
+                {**scene.definition, "expires": scene.expires}
+                for scene in self._scenes if scene.definition is not None
+            ],
+            "frame": base64.b64encode(frame).decode("ascii") if frame else None,
+            # The scene that drew `frame`; an expired alert must not stay up
+            "frame_scene": self._scenes[-1].digest if self._scenes else None,
+        }
+
+    async def _async_restore(self) -> None:
+        try:
+            data = await self._store.async_load()
+        except Exception as e:
+            _LOGGER.warning(f"Could not load stored scenes for UMP {self._mac}: {e}")
             return
+        if not data: return
 
-        cycle_time = speed + scroll_duration
-        total_time = cycle_time * num_lines
-        
-        current_time_in_cycle = now % total_time
-        line_idx = int(current_time_in_cycle / cycle_time)
-        time_in_phase = current_time_in_cycle % cycle_time
-
-        next_idx = (line_idx + 1) % num_lines
-
-        draw_curr = el.copy(); draw_curr['type'] = 'text'; draw_curr['content'] = lines[line_idx]
-        draw_next = el.copy(); draw_next['type'] = 'text'; draw_next['content'] = lines[next_idx]
+        self._is_on = data.get("is_on", True)
+        self._attr_brightness = data.get("brightness", self._attr_brightness)
+        self.async_write_ha_state()
 
-        if time_in_phase < speed:
-            draw_curr['x'] = base_x
-            draw_curr['y'] = base_y
-            self._draw_text_element(canvas, draw_curr)
+        frame = base64.b64decode(data["frame"]) if data.get("frame") else None
+        if frame and self._is_on:
+            # One frame write, queued behind nothing: the panel is back to what
+            # it showed before the restart while the scenes compile below
+            self._client.restore_frame(frame)
+
+        restored = []
+        for stored in data.get("scenes", []):
+            expires = stored.get("expires")
+            if expires is not None and expires <= time.time(): continue
+            # A draw_visuals call that arrived during startup wins
+            if any(s.priority == stored.get("priority", 0) for s in self._scenes): continue
+            try:
+                scene = await self._build_scene(
+                    [valid_element(el) for el in stored["elements"]],
+                    valid_color(stored.get("background", [0, 0, 0])),
+                    stored.get("fps", 10),
+                    stored.get("priority", 0),
+                )
+            except Exception as e:
+                _LOGGER.warning(f"Dropping stored scene for UMP {self._mac}: {e}")
+                continue
+            # ... also one that arrived while this scene was being rebuilt
+            if any(s.priority == scene.priority for s in self._scenes): continue
+            now = time.time()
+            if expires is not None and expires <= now: continue
+            self._push_scene(scene, expires - now if expires is not None else None)
+            restored.append(scene)
+
+        if not self._scenes or not self._is_on: return
+        top = self._scenes[-1]
+        # Whatever a startup draw_visuals call put on top is already showing
+        if top not in restored: return
+        if top.animated or frame is None or top.digest is None or top.digest != data.get("frame_scene"):
+            # Unless the stored frame is this static scene, it is already on the panel
+            await self._show_scene(top)
+
+    async def _show_scene(self, scene: Scene) -> None:
+        self._clock.stop(self)
+
+        # Animated scenes get a persistent connection slot
+        self._client.set_persistent(scene.animated)
+        if scene.animated:
+            self._clock.start(self, self._renderer, scene, self._send_animation_frame, scene.images)
         else:
-            anim_progress = (time_in_phase - speed) / scroll_duration
-            if anim_progress > 1.0: anim_progress = 1.0
-            
-            offset_y = 0; offset_x = 0
-            
-            if direction == 'up':
-                offset_y = int(anim_progress * line_h)
-                draw_curr['y'] = base_y - offset_y
-                draw_next['y'] = base_y + line_h - offset_y
-                draw_curr['x'] = base_x; draw_next['x'] = base_x
-
-            elif direction == 'down':
-                offset_y = int(anim_progress * line_h)
-                draw_curr['y'] = base_y + offset_y
-                draw_next['y'] = base_y - line_h + offset_y
-                draw_curr['x'] = base_x; draw_next['x'] = base_x
-
-            elif direction == 'left':
-                offset_x = int(anim_progress * self._width)
-                draw_curr['x'] = base_x - offset_x
-                draw_next['x'] = base_x + self._width - offset_x
-                draw_curr['y'] = base_y; draw_next['y'] = base_y
-
-            elif direction == 'right':
-                offset_x = int(anim_progress * self._width)
-                draw_curr['x'] = base_x + offset_x
-                draw_next['x'] = base_x - self._width + offset_x
-                draw_curr['y'] = base_y; draw_next['y'] = base_y
-
-            self._draw_text_element(canvas, draw_curr)
-            self._draw_text_element(canvas, draw_next)
-
-    def _draw_textscroll_element(self, canvas, draw, el: Dict[str, Any]) -> None:
-        content = sanitize_text(str(el.get('content', '')))
-        if not content: return
-        y = int(el.get('y', 0))
-        font_name = el.get('font', '5x7')
-        spacing = int(el.get('spacing', 1))
-        speed = int(el.get('speed', 10))
-        text_width = self._measure_text_width(content, font_name, spacing)
-        
-        if text_width < 1: return
-        total_distance = self._width + text_width
-        offset = (time.time() * speed) % total_distance
-        x = int(self._width - offset)
-        
-        temp_el = el.copy()
-        temp_el['type'] = 'text'
-        temp_el['content'] = content 
-        temp_el['x'] = x
-        self._draw_text_element(canvas, temp_el)
-
-    def _draw_pixels_element(self, canvas: Image.Image, el: Dict[str, Any]) -> None:
-        pixels = el.get('pixels', [])
-        if not pixels: return
-
-        layer = Image.new('RGBA', (self._width, self._height), (0, 0, 0, 0))
-        draw_access = layer.load()
-        w, h = self._width, self._height
-        
-        try:
-            for p in pixels:
-                if len(p) >= 5:
-                    draw_access[p[0], p[1]] = (p[2], p[3], p[4], p[5] if len(p) > 5 else 255)
-        except Exception:
-            pass
-        
-        canvas.alpha_composite(layer)
-
-    def _draw_mdi_element(self, canvas, el: Dict[str, Any]):
-        if not self._mdi_ready: return
-        raw_name = str(el.get('name', 'mdi:help'))
-        icon_name = raw_name[4:] if raw_name.startswith("mdi:") else raw_name
-        hex_code = self._mdi_map.get(icon_name)
-        if not hex_code: return
-        icon_char = chr(int(hex_code, 16))
-        size = int(el.get('size', 16))
-        c = el.get('color', [255, 255, 255])
-        color = tuple(c)
-        if len(color) == 3: color = color + (255,)
-        x, y = int(el.get('x', 0)), int(el.get('y', 0))
-        
-        font = self._mdi_fonts.get(size)
-        if not font:
+            # STATIC FRAME LOGIC
+            # The client drops the frame if the panel already shows it
+            png = self._static_frame(scene)
             try:
-                font = ImageFont.truetype(self._font_path, size)
-                self._mdi_fonts[size] = font
-            except Exception: return
-            
-        layer = Image.new('RGBA', canvas.size, (0, 0, 0, 0))
-        layer_draw = ImageDraw.Draw(layer)
-        layer_draw.text((x, y), icon_char, font=font, fill=color)
-        canvas.alpha_composite(layer)
+                await self._client.submit_png(png)
+            except Exception as e:
+                _LOGGER.warning(f"UMP device disconnected while sending frame: {e}")
+                # Not on the panel: an identical retry must send it again, and
+                # the client keeps retrying this frame rather than an older one
+                scene.digest = None
+                self._client.restore_frame(png)
+
+    def _send_animation_frame(self, png_data: bytes) -> None:
+        # Called by the clock each tick; unchanged frames are dropped by the
+        # client and a slow link only ever has the newest frame queued
+        self._client.submit_png(png_data).add_done_callback(self._animation_frame_sent)
+
+    def _animation_frame_sent(self, fut: asyncio.Future) -> None:
+        if fut.cancelled() or fut.exception() is None: return
+        _LOGGER.warning(f"Error sending frame (animation): {fut.exception()}")
+        # Wait a bit longer if connection failed before retrying
+        self._clock.hold(self, 5.0)
+
+    def _static_frame(self, scene: Scene) -> bytes:
+        # Same scene, panel size and source pictures -> same PNG, whichever
+        # display asked for it first
+        sources = [scene.images[idx].info.get("ump_source") for idx in sorted(scene.images)]
+        key = None if scene.digest is None or None in sources else (scene.digest, *self._renderer.size, *sources)
+        png = CACHE.get("frames", key) if key else None
+        if png is None:
+            canvas = self._render_canvas_sync(scene.elements, scene.background)
+            png = encode_frame(canvas, *self._renderer.size)
+            if key: CACHE.put("frames", key, png, len(png) + ENTRY_OVERHEAD)
+        return png
+
+    def _render_canvas_sync(self, elements: list, background: tuple) -> Image.Image:
+        return self._renderer.render(elements, background)
+
+    @staticmethod
+    def _scene_digest(elements: list, background: tuple, fps: int) -> str:
+        return digest([elements, list(background), fps])
+
+    async def _build_scene(self, elements: list, background: tuple, fps: int, priority: int) -> Scene:
+        if any(el['type'] == 'icon' for el in elements):
+            # Shared across displays; only the first icon ever pays for loading it
+            await self._hass.async_add_executor_job(self._renderer.load_mdi)
+        # Elements unchanged since a scene still on the stack are not wrapped
+        # or rasterized again
+        reuse: Dict[str, Tuple[Any, Any]] = {}
+        for old in self._scenes:
+            reuse.update(old.parts)
+        parts: Dict[str, Tuple[Any, Any]] = {}
+        compiled = []
+        images = {}
+        for idx, el in enumerate(elements):
+            key = digest(el)
+            part = parts.get(key)
+            if part is None and el['type'] == 'image':
+                # The same path or url may serve a new picture (snapshots,
+                # camera_proxy): always fetched, and only reused when the
+                # content-addressed decode hands back the very same image
+                img = await self._fetch_and_process_image(el)
+                part = reuse.get(key)
+                if part is None or img is None or part[1] is not img:
+                    part = (self._renderer.compile_element(el, img), img)
+                # A failed fetch is retried by the next call
+                if img is not None:
+                    parts[key] = part
+            elif part is None:
+                part = reuse.get(key) or (self._renderer.compile_element(el, None), None)
+                parts[key] = part
+            item, img = part
+            if img is not None: images[idx] = img
+            if item is not None: compiled.append(item)
+        definition = {"elements": elements, "background": list(background), "fps": fps, "priority": priority}
+        scene = Scene(compiled, background, fps, priority, definition)
+        # Decoded sources, so render workers never fetch anything themselves
+        scene.images = images
+        scene.parts = parts
+        scene.digest = self._scene_digest(elements, background, fps)
+        return scene
 
     async def _fetch_and_process_image(self, el: Dict[str, Any]) -> Optional[Image.Image]:
         image_data = None
@@ -552,22 +383,34 @@ class IDMDisplayEntity(LightEntity):
             if self._hass.config.is_allowed_path(path):
                 try:
                     def load_local():
+                        if os.path.getsize(path) > MAX_IMAGE_BYTES:
+                            raise ValueError("file too large")
                         with open(path, "rb") as f: return f.read()
                     image_data = await self._hass.async_add_executor_job(load_local)
-                except Exception: pass
+                except Exception as e:
+                    _LOGGER.debug(f"Could not read image {path}: {e}")
         elif 'url' in el:
             try:
-                session = async_get_clientsession(self._hass)
-                async with session.get(el['url'], timeout=10) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-            except Exception: pass
+                image_data = await self._download_image(el['url'])
+            except Exception as e:
+                _LOGGER.debug(f"Could not download image {el['url']}: {e}")
         if image_data:
-            try:
-                img = Image.open(BytesIO(image_data)).convert("RGBA")
-                w, h = el.get('width'), el.get('height')
-                if w and h:
-                    img = img.resize((int(w), int(h)), Image.Resampling.NEAREST)
-                return img
-            except Exception: pass
+            # Decoding even a downscaled photo is too slow for the event loop
+            return await self._hass.async_add_executor_job(
+                decode_image, image_data, el.get('width'), el.get('height'), el.get('resample', 'nearest'))
         return None
+
+    async def _download_image(self, url: str) -> Optional[bytes]:
+        # Streamed with a size cap, so a huge or endless response is cut off
+        # instead of being buffered whole
+        session = async_get_clientsession(self._hass)
+        async with session.get(url, timeout=10) as response:
+            if response.status != 200: return None
+            if (response.content_length or 0) > MAX_IMAGE_BYTES:
+                raise ValueError(f"{response.content_length} bytes is too large")
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data += chunk
+                if len(data) > MAX_IMAGE_BYTES:
+                    raise ValueError(f"more than {MAX_IMAGE_BYTES} bytes")
+            return bytes(data)
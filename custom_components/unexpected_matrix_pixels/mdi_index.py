@@ -0,0 +1,184 @@
+from __future__ import annotations
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# On-disk index: header, (count + 1) name offsets, count codepoints, sorted
+# utf-8 name blob. Looked up by binary search straight from the mmap.
+_MAGIC = b"UMPI"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHII")  # magic, version, count, source ttf size
+
+_INDEXES: Dict[str, Optional["MdiIndex"]] = {}
+_LOCK = threading.Lock()
+
+
+def _read_tables(data: bytes) -> Dict[bytes, int]:
+    num_tables = struct.unpack_from(">H", data, 4)[0]
+    tables = {}
+    for i in range(num_tables):
+        tag, _, offset, _ = struct.unpack_from(">4sIII", data, 12 + 16 * i)
+        tables[tag] = offset
+    return tables
+
+
+def _read_cmap(data: bytes, cmap: int) -> Dict[int, int]:
+    # glyph id -> lowest codepoint, from the format 12 (or 4) unicode subtable
+    num_subtables = struct.unpack_from(">H", data, cmap + 2)[0]
+    subtables = {}
+    for i in range(num_subtables):
+        _, _, offset = struct.unpack_from(">HHI", data, cmap + 4 + 8 * i)
+        fmt = struct.unpack_from(">H", data, cmap + offset)[0]
+        subtables[fmt] = cmap + offset
+
+    glyph_to_cp: Dict[int, int] = {}
+    if 12 in subtables:
+        sub = subtables[12]
+        num_groups = struct.unpack_from(">I", data, sub + 12)[0]
+        for i in range(num_groups):
+            start, end, glyph = struct.unpack_from(">III", data, sub + 16 + 12 * i)
+            for cp in range(start, end + 1):
+                glyph_to_cp.setdefault(glyph + cp - start, cp)
+    elif 4 in subtables:
+        sub = subtables[4]
+        seg_x2 = struct.unpack_from(">H", data, sub + 6)[0]
+        ends = sub + 14
+        starts = ends + seg_x2 + 2
+        deltas = starts + seg_x2
+        ranges = deltas + seg_x2
+        for seg in range(seg_x2 // 2):
+            end = struct.unpack_from(">H", data, ends + 2 * seg)[0]
+            start = struct.unpack_from(">H", data, starts + 2 * seg)[0]
+            delta = struct.unpack_from(">h", data, deltas + 2 * seg)[0]
+            range_offset = struct.unpack_from(">H", data, ranges + 2 * seg)[0]
+            for cp in range(start, end + 1):
+                if cp == 0xFFFF: continue
+                if range_offset:
+                    addr = ranges + 2 * seg + range_offset + 2 * (cp - start)
+                    glyph = struct.unpack_from(">H", data, addr)[0]
+                    if glyph: glyph = (glyph + delta) & 0xFFFF
+                else:
+                    glyph = (cp + delta) & 0xFFFF
+                if glyph: glyph_to_cp.setdefault(glyph, cp)
+    return glyph_to_cp
+
+
+def _read_post_names(data: bytes, post: int) -> Dict[int, str]:
+    # Only format 2.0 carries custom glyph names (the icon names)
+    if struct.unpack_from(">I", data, post)[0] != 0x00020000:
+        return {}
+    num_glyphs = struct.unpack_from(">H", data, post + 32)[0]
+    name_ids = struct.unpack_from(f">{num_glyphs}H", data, post + 34)
+    pos = post + 34 + 2 * num_glyphs
+    custom = []
+    needed = max(name_ids, default=0) - 257
+    while len(custom) < needed and pos < len(data):
+        length = data[pos]
+        custom.append(data[pos + 1:pos + 1 + length].decode("latin-1"))
+        pos += 1 + length
+    names = {}
+    for glyph, name_id in enumerate(name_ids):
+        if name_id >= 258 and name_id - 258 < len(custom):
+            names[glyph] = custom[name_id - 258]
+    return names
+
+
+def build_index(ttf_path: str) -> bytes:
+    with open(ttf_path, "rb") as f:
+        data = f.read()
+    tables = _read_tables(data)
+    glyph_to_cp = _read_cmap(data, tables[b"cmap"])
+    names = _read_post_names(data, tables[b"post"])
+
+    entries = sorted(
+        (name.encode("utf-8"), glyph_to_cp[glyph])
+        for glyph, name in names.items()
+        if name and glyph in glyph_to_cp
+    )
+    offsets = [0]
+    for name, _ in entries:
+        offsets.append(offsets[-1] + len(name))
+
+    out = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(entries), len(data)))
+    out += struct.pack(f"<{len(offsets)}I", *offsets)
+    out += struct.pack(f"<{len(entries)}I", *(cp for _, cp in entries))
+    out += b"".join(name for name, _ in entries)
+    return bytes(out)
+
+
+class MdiIndex:
+    def __init__(self, buf) -> None:
+        self._buf = buf
+        _, _, self._count, _ = _HEADER.unpack_from(buf, 0)
+        self._offsets = _HEADER.size
+        self._codepoints = self._offsets + 4 * (self._count + 1)
+        self._names = self._codepoints + 4 * self._count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def codepoint(self, name: str) -> Optional[int]:
+        key = name.encode("utf-8")
+        buf = self._buf
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = struct.unpack_from("<II", buf, self._offsets + 4 * mid)
+            probe = buf[self._names + start:self._names + end]
+            if probe == key:
+                return struct.unpack_from("<I", buf, self._codepoints + 4 * mid)[0]
+            if probe < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+
+def _is_current(buf, ttf_size: int) -> bool:
+    if len(buf) < _HEADER.size: return False
+    magic, version, _, size = _HEADER.unpack_from(buf, 0)
+    return magic == _MAGIC and version == _VERSION and size == ttf_size
+
+
+def _load(ttf_path: str) -> MdiIndex:
+    index_path = os.path.splitext(ttf_path)[0] + ".idx"
+    ttf_size = os.path.getsize(ttf_path)
+
+    if os.path.exists(index_path) and os.path.getsize(index_path) >= _HEADER.size:
+        with open(index_path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if _is_current(buf, ttf_size):
+            return MdiIndex(buf)
+        buf.close()
+
+    data = build_index(ttf_path)
+    try:
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, index_path)
+        with open(index_path, "rb") as f:
+            return MdiIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except OSError as e:
+        # Read-only install: keep the freshly built index in memory instead
+        _LOGGER.debug(f"Could not write MDI index {index_path}: {e}")
+        return MdiIndex(data)
+
+
+def get_mdi_index(ttf_path: str) -> Optional[MdiIndex]:
+    # Blocking on first call (may build the index); shared by all displays
+    if ttf_path in _INDEXES:
+        return _INDEXES[ttf_path]
+    with _LOCK:
+        if ttf_path not in _INDEXES:
+            try:
+                _INDEXES[ttf_path] = _load(ttf_path)
+            except Exception as e:
+                _LOGGER.error(f"Failed to load MDI icon index from {ttf_path}: {e}")
+                _INDEXES[ttf_path] = None
+        return _INDEXES[ttf_path]
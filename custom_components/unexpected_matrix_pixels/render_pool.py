@@ -0,0 +1,215 @@
+from __future__ import annotations
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple, Union
+from PIL import Image
+from .cache import CACHE
+from .mdi_index import get_mdi_index
+from .renderer import MDI_FONT_PATH, SceneRenderer, encode_frame
+from .scene import ImageElement, Scene, SpriteElement
+
+# Opt-in process pool for heavy animated scenes (photos, icons, pixel art).
+# Each worker compiles a scene once from its definition and keeps it; decoded
+# images reach the workers through shared memory, and finished frames come
+# back the same way, so nothing but small task tuples is pickled per frame.
+# Free of Home Assistant imports: workers are spawned and import this module.
+
+_LOGGER = logging.getLogger(__name__)
+
+# Per worker: compiled scenes and attached frame buffers kept around
+_WORKER_SCENES = 16
+_WORKER_BUFFERS = 64
+
+# (shared memory name, width, height) of an RGBA source image
+ImageSpec = Tuple[str, int, int]
+# (shared memory name, length) of the pickled element definitions and images
+SceneSpec = Tuple[str, int]
+
+
+def wants_pool(scene: Scene) -> bool:
+    # Text-only scenes are cheaper to render than to ship to another process
+    return any(isinstance(el, (ImageElement, SpriteElement)) for el in scene.elements)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before 3.13 every attach registers with the resource tracker, which
+        # would then unlink the parent's segment when this worker exits
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# --- WORKER SIDE ---
+
+_renderers: Dict[Tuple[int, int], SceneRenderer] = {}
+_scenes: "OrderedDict[int, list]" = OrderedDict()
+_buffers: "OrderedDict[str, shared_memory.SharedMemory]" = OrderedDict()
+
+
+def _init_worker(font_dir: Optional[str], cache_budget: int) -> None:
+    # Warm the per-process caches once instead of on the first frame
+    CACHE.set_budget(cache_budget)
+    if font_dir:
+        from .text import load_user_fonts
+        load_user_fonts(font_dir)
+    get_mdi_index(MDI_FONT_PATH)
+
+
+def _worker_scene(token: int, size: Tuple[int, int], spec: SceneSpec) -> list:
+    compiled = _scenes.get(token)
+    if compiled is not None:
+        _scenes.move_to_end(token)
+        return compiled
+    renderer = _renderers.get(size)
+    if renderer is None:
+        renderer = _renderers[size] = SceneRenderer(*size)
+    name, length = spec
+    shm = _attach(name)
+    try:
+        elements, images = pickle.loads(shm.buf[:length])
+    finally:
+        shm.close()
+    decoded = {}
+    for idx, (name, width, height) in images.items():
+        shm = _attach(name)
+        try:
+            decoded[idx] = Image.frombuffer("RGBA", (width, height), shm.buf, "raw", "RGBA", 0, 1).copy()
+        finally:
+            shm.close()
+    compiled = _scenes[token] = renderer.compile_elements(elements, decoded)
+    if len(_scenes) > _WORKER_SCENES:
+        _scenes.popitem(last=False)
+    return compiled
+
+
+def _worker_buffer(name: str) -> shared_memory.SharedMemory:
+    shm = _buffers.get(name)
+    if shm is None:
+        shm = _buffers[name] = _attach(name)
+        if len(_buffers) > _WORKER_BUFFERS:
+            _buffers.popitem(last=False)[1].close()
+    else:
+        _buffers.move_to_end(name)
+    return shm
+
+
+def _render_task(token: int, size: Tuple[int, int], spec: SceneSpec,
+                 background: tuple, now: float, frame_name: str) -> Union[int, bytes]:
+    compiled = _worker_scene(token, size, spec)
+    png = encode_frame(_renderers[size].render(compiled, background, now), *size)
+    shm = _worker_buffer(frame_name)
+    if len(png) > shm.size:
+        return png  # does not fit (should not happen): fall back to pickling
+    shm.buf[:len(png)] = png
+    return len(png)
+
+
+# --- HOME ASSISTANT SIDE ---
+
+class _PoolScene:
+    __slots__ = ("token", "scene", "size", "spec", "segments", "frame")
+
+    def __init__(self, token: int, scene: Scene, size: Tuple[int, int]) -> None:
+        self.token = token
+        self.scene = scene
+        self.size = size
+        self.spec: Optional[SceneSpec] = None
+        self.segments = []
+        # Worst case PNG of an incompressible frame, plus headroom
+        width, height = size
+        self.frame = shared_memory.SharedMemory(create=True, size=width * height * 3 + height + 4096)
+
+    def close(self) -> None:
+        for shm in [self.frame, *self.segments]:
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
+        self.segments = []
+
+
+class RenderPool:
+    def __init__(self, workers: int, font_dir: Optional[str] = None) -> None:
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            # Forking a process as threaded as Home Assistant is not safe
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(font_dir, CACHE.budget),
+        )
+        self._scenes: Dict[Any, _PoolScene] = {}
+        self._tokens = itertools.count(1)
+
+    def start(self) -> None:
+        # Blocking: spawn every worker now rather than on the first frames
+        for future in [self._executor.submit(int) for _ in range(self.workers)]:
+            future.result()
+
+    def prepare(self, key: Any, scene: Scene, images: Dict[int, Image.Image], size: Tuple[int, int]) -> None:
+        self.release(key)
+        entry = _PoolScene(next(self._tokens), scene, size)
+        try:
+            specs: Dict[int, ImageSpec] = {}
+            for idx, img in images.items():
+                if img.mode != "RGBA": img = img.convert("RGBA")
+                shm = self._share(entry, img.tobytes())
+                specs[idx] = (shm.name, img.width, img.height)
+            # Sent once: tasks only carry the segment name, and a worker only
+            # reads it when it has not compiled this scene yet
+            data = pickle.dumps((scene.definition["elements"], specs), pickle.HIGHEST_PROTOCOL)
+            entry.spec = (self._share(entry, data).name, len(data))
+        except Exception:
+            entry.close()
+            raise
+        self._scenes[key] = entry
+
+    @staticmethod
+    def _share(entry: _PoolScene, data: bytes) -> shared_memory.SharedMemory:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        entry.segments.append(shm)
+        shm.buf[:len(data)] = data
+        return shm
+
+    def has(self, key: Any, scene: Scene) -> bool:
+        entry = self._scenes.get(key)
+        return entry is not None and entry.scene is scene
+
+    async def render(self, key: Any, now: float) -> Optional[bytes]:
+        entry = self._scenes.get(key)
+        if entry is None:
+            return None  # released before the tick got to it
+        scene = entry.scene
+        result = await asyncio.get_running_loop().run_in_executor(
+            self._executor, _render_task, entry.token, entry.size, entry.spec,
+            scene.background, now, entry.frame.name,
+        )
+        if self._scenes.get(key) is not entry:
+            return None  # released while rendering
+        if isinstance(result, bytes):
+            return result
+        return bytes(entry.frame.buf[:result])
+
+    def release(self, key: Any) -> None:
+        entry = self._scenes.pop(key, None)
+        if entry: entry.close()
+
+    def shutdown(self) -> None:
+        # Blocking
+        for key in list(self._scenes):
+            self.release(key)
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,292 @@
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+from typing import Any, Dict, Optional
+from PIL import Image, ImageDraw, ImageFont
+from .cache import CACHE, ENTRY_OVERHEAD, image_cost
+from .compositor import Compositor, image_layer, layer_cost
+from .mdi_index import get_mdi_index
+from .scene import (
+    ImageElement, SpriteElement, TextElement, TextLongElement, TextScrollElement,
+)
+from .text import layout_mask, line_height, sanitize_text, wrap_text
+
+# Scene compilation and rendering. Deliberately free of Home Assistant imports
+# so it can be profiled, tested and run headless (see tools/ump_render.py).
+
+_LOGGER = logging.getLogger(__name__)
+
+MDI_FONT_PATH = os.path.join(os.path.dirname(__file__), 'materialdesignicons-webfont.ttf')
+# FreeType face plus its glyph cache, per icon size
+ICON_FONT_COST = 96 * 1024
+# Larger sources are refused before anything is decoded
+MAX_IMAGE_BYTES = 8 * 2**20
+MAX_IMAGE_PIXELS = 4096 * 4096
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "area": Image.Resampling.BOX,
+}
+
+
+def decode_image(image_data: bytes, width: Optional[int] = None, height: Optional[int] = None,
+                 resample: str = "nearest") -> Optional[Image.Image]:
+    # Keyed by content, so a URL that now serves a different picture misses
+    source = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+    key = (source, width, height, resample)
+    img = CACHE.get("images", key)
+    if img is not None:
+        return img
+    try:
+        img = Image.open(BytesIO(image_data))
+        if img.width * img.height > MAX_IMAGE_PIXELS:
+            raise ValueError(f"{img.width}x{img.height} is too large")
+        if width and height:
+            img = _shrink(img, int(width), int(height), RESAMPLE_FILTERS.get(resample, Image.Resampling.NEAREST))
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+    except Exception as e:
+        _LOGGER.debug(f"Could not decode image: {e}")
+        return None
+    img.info["ump_source"] = source
+    return CACHE.put("images", key, img, image_cost(img))
+
+
+def _shrink(img: Image.Image, width: int, height: int, resample: int) -> Image.Image:
+    # Album art and snapshots are 10-40x the panel: let the JPEG decoder
+    # scale by 1/2..1/8 while decoding (draft), reduce by whole factors, and
+    # only then resample to the target box. Colours are converted at the end,
+    # at panel size.
+    if img.format == "JPEG":
+        img.draft("RGB", (width, height))
+    if img.mode not in ("RGB", "RGBA", "L"):
+        # Palette and bilevel images only resample with NEAREST
+        img = img.convert("RGBA")
+    if img.size == (width, height):
+        return img
+    gap = 2.0 if resample != Image.Resampling.NEAREST else None
+    return img.resize((width, height), resample, reducing_gap=gap)
+
+
+def encode_frame(img: Image.Image, width: int, height: int) -> bytes:
+    # The PNG the panel is sent
+    if img.size != (width, height):
+        img = img.resize((width, height), Image.Resampling.NEAREST)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    buf = BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class SceneRenderer:
+    def __init__(self, width: int, height: int, font_path: str = MDI_FONT_PATH) -> None:
+        self._width = width
+        self._height = height
+        self._font_path = font_path
+        # One accumulation buffer per display, reused by every frame
+        self._compositor = Compositor(width, height)
+        self._lock = threading.Lock()
+
+        self._draw_funcs = {
+            TextElement: self._draw_text_element,
+            TextScrollElement: self._draw_textscroll_element,
+            TextLongElement: self._draw_textlong_element,
+            SpriteElement: self._draw_sprite_element,
+            ImageElement: self._draw_image_element,
+        }
+
+    @property
+    def size(self) -> tuple:
+        return self._width, self._height
+
+    def load_mdi(self) -> None:
+        # Blocking on first use; call from an executor before compiling icons
+        get_mdi_index(self._font_path)
+
+    def compile_elements(self, elements: list, images: Optional[Dict[int, Image.Image]] = None) -> list:
+        # `elements` are validated dicts (scene.valid_element); `images` maps the
+        # index of each image element to its already decoded picture.
+        compiled = []
+        for idx, el in enumerate(elements):
+            item = self.compile_element(el, images.get(idx) if images else None)
+            if item is not None: compiled.append(item)
+        return compiled
+
+    def compile_element(self, el: Dict[str, Any], image: Optional[Image.Image] = None) -> Any:
+        # None for elements that draw nothing
+        el_type = el['type']
+        if el_type == 'image':
+            return self._compile_image(el['x'], el['y'], image) if image else None
+        if el_type == 'text':
+            content = sanitize_text(el['content'], el['font'])
+            mask, width = layout_mask(content, el['font'], el['spacing'])
+            return TextElement(el['x'], el['y'], el['color'], mask, width)
+        if el_type == 'textscroll':
+            content = sanitize_text(el['content'], el['font'])
+            mask, width = layout_mask(content, el['font'], el['spacing'])
+            if width < 1: return None
+            return TextScrollElement(el['y'], el['color'], mask, width, el['speed'])
+        if el_type == 'textlong':
+            font_name, spacing = el['font'], el['spacing']
+            lines = wrap_text(sanitize_text(el['content'], el['font']), font_name, spacing, self._width)
+            line_masks = tuple(layout_mask(line, font_name, spacing)[0] for line in lines)
+            return TextLongElement(
+                el['x'], el['y'], el['color'], line_masks,
+                el['speed'], el['scroll_duration'], el['direction'], line_height(font_name)
+            )
+        if el_type == 'pixels':
+            return self._compile_pixels(el['pixels'])
+        if el_type == 'icon':
+            return self._compile_icon(el)
+        return None
+
+    def render(self, elements: list, background: tuple, now: Optional[float] = None) -> Image.Image:
+        if now is None: now = time.time()
+        # The executor batch and a static frame may render for the same display
+        with self._lock:
+            canvas = self._compositor
+            canvas.clear(background)
+            for el in elements:
+                self._draw_funcs[type(el)](canvas, el, now)
+            return canvas.to_image()
+
+    def _visible(self, x: int, y: int, width: int, height: int) -> Optional[tuple]:
+        # (left, top, right, bottom) of the part of a width x height source at
+        # (x, y) that lands on the canvas, in source coordinates
+        x0, y0 = max(0, -x), max(0, -y)
+        x1, y1 = min(width, self._width - x), min(height, self._height - y)
+        if x1 <= x0 or y1 <= y0: return None
+        return x0, y0, x1, y1
+
+    def _compile_image(self, x: int, y: int, image: Image.Image) -> Optional[ImageElement]:
+        # Only the visible part is converted: a layer costs 20 bytes a pixel,
+        # and an unscaled photo would otherwise be held at full size
+        box = self._visible(x, y, image.width, image.height)
+        if box is None: return None
+        if box != (0, 0, image.width, image.height):
+            image = image.crop(box)
+        return ImageElement(x + box[0], y + box[1], image_layer(image))
+
+    def _compile_pixels(self, pixels: list) -> Optional[SpriteElement]:
+        if not pixels: return None
+        layer = Image.new('RGBA', (self._width, self._height), (0, 0, 0, 0))
+        draw_access = layer.load()
+        for x, y, rgba in pixels:
+            if 0 <= x < self._width and 0 <= y < self._height:
+                draw_access[x, y] = rgba
+        bbox = layer.getbbox()
+        if not bbox: return None
+        return SpriteElement(bbox[0], bbox[1], image_layer(layer.crop(bbox)))
+
+    def _compile_icon(self, el: Dict[str, Any]) -> Optional[SpriteElement]:
+        mdi = get_mdi_index(self._font_path)
+        if mdi is None: return None
+        raw_name = el['name']
+        icon_name = raw_name[4:] if raw_name.startswith("mdi:") else raw_name
+        codepoint = mdi.codepoint(icon_name)
+        if codepoint is None:
+            _LOGGER.warning(f"Unknown MDI icon: {raw_name}")
+            return None
+        size = el['size']
+        color = tuple(el['color'])
+
+        # (left, top, layer), shared by every display drawing the same icon
+        key = (self._font_path, codepoint, size, color)
+        cached = CACHE.get("icons", key)
+        if cached is None:
+            sprite = self._rasterize_icon(chr(codepoint), size, color)
+            if sprite is None: return None
+            left, top, img = sprite
+            cached = (left, top, image_layer(img))
+            CACHE.put("icons", key, cached, layer_cost(cached[2]) + ENTRY_OVERHEAD)
+        left, top, layer = cached
+        x, y = el['x'] + left, el['y'] + top
+        box = self._visible(x, y, layer[0].shape[1], layer[0].shape[0])
+        if box is None: return None
+        # Views into the shared layer: cropping costs no memory
+        x0, y0, x1, y1 = box
+        return SpriteElement(x + x0, y + y0, (layer[0][y0:y1, x0:x1], layer[1][y0:y1, x0:x1]))
+
+    def _rasterize_icon(self, icon_char: str, size: int, color: tuple) -> Optional[tuple]:
+        font_key = (self._font_path, size)
+        font = CACHE.get("icon_fonts", font_key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(self._font_path, size)
+            except Exception: return None
+            CACHE.put("icon_fonts", font_key, font, ICON_FONT_COST)
+
+        left, top, right, bottom = font.getbbox(icon_char)
+        if right <= left or bottom <= top: return None
+        sprite = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+        ImageDraw.Draw(sprite).text((-left, -top), icon_char, font=font, fill=color)
+        return left, top, sprite
+
+    def _draw_text_element(self, canvas: Compositor, el: TextElement, now: float) -> None:
+        canvas.fill(el.mask, el.x, el.y, el.color)
+
+    def _draw_textlong_element(self, canvas: Compositor, el: TextLongElement, now: float) -> None:
+        lines = el.lines
+        base_x, base_y = el.x, el.y
+        num_lines = len(lines)
+
+        if num_lines == 1:
+            canvas.fill(lines[0], base_x, base_y, el.color)
+            return
+
+        cycle_time = el.hold + el.scroll_duration
+        total_time = cycle_time * num_lines
+
+        current_time_in_cycle = now % total_time
+        line_idx = int(current_time_in_cycle / cycle_time) % num_lines
+        time_in_phase = current_time_in_cycle % cycle_time
+
+        curr = lines[line_idx]
+        next_ = lines[(line_idx + 1) % num_lines]
+
+        if time_in_phase < el.hold:
+            canvas.fill(curr, base_x, base_y, el.color)
+            return
+
+        anim_progress = (time_in_phase - el.hold) / el.scroll_duration if el.scroll_duration else 1.0
+        if anim_progress > 1.0: anim_progress = 1.0
+
+        curr_x = next_x = base_x
+        curr_y = next_y = base_y
+        direction = el.direction
+
+        if direction == 'up':
+            offset_y = int(anim_progress * el.line_h)
+            curr_y = base_y - offset_y
+            next_y = base_y + el.line_h - offset_y
+        elif direction == 'down':
+            offset_y = int(anim_progress * el.line_h)
+            curr_y = base_y + offset_y
+            next_y = base_y - el.line_h + offset_y
+        elif direction == 'left':
+            offset_x = int(anim_progress * self._width)
+            curr_x = base_x - offset_x
+            next_x = base_x + self._width - offset_x
+        elif direction == 'right':
+            offset_x = int(anim_progress * self._width)
+            curr_x = base_x + offset_x
+            next_x = base_x - self._width + offset_x
+
+        canvas.fill(curr, curr_x, curr_y, el.color)
+        canvas.fill(next_, next_x, next_y, el.color)
+
+    def _draw_textscroll_element(self, canvas: Compositor, el: TextScrollElement, now: float) -> None:
+        total_distance = self._width + el.width
+        offset = (now * el.speed) % total_distance
+        x = int(self._width - offset)
+        canvas.fill(el.mask, x, el.y, el.color)
+
+    def _draw_sprite_element(self, canvas: Compositor, el: SpriteElement, now: float) -> None:
+        canvas.blend(el.layer, el.x, el.y)
+
+    def _draw_image_element(self, canvas: Compositor, el: ImageElement, now: float) -> None:
+        canvas.blend(el.layer, el.x, el.y)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+import voluptuous as vol
+from .bitmap_fonts import font_names, get_bitmap_font
+from .compositor import Layer, Mask
+from .text import BUILTIN_FONTS
+
+FONTS = BUILTIN_FONTS
+# Older configs (and the script demo) spell the 5x7 font this way
+FONT_ALIASES = {"7x5": "5x7"}
+DIRECTIONS = ("up", "down", "left", "right")
+RESAMPLE = ("nearest", "area")
+
+Color = Tuple[int, int, int, int]
+
+
+def valid_color(value: Any) -> Color:
+    if not isinstance(value, (list, tuple)) or len(value) not in (3, 4):
+        raise vol.Invalid("color must be [r, g, b] or [r, g, b, a]")
+    try:
+        rgba = tuple(max(0, min(255, int(c))) for c in value)
+    except (TypeError, ValueError) as e:
+        raise vol.Invalid(f"invalid color {value}") from e
+    if len(rgba) == 3:
+        rgba = rgba + (255,)
+    return rgba
+
+
+def valid_font(value: Any) -> str:
+    value = str(value)
+    value = FONT_ALIASES.get(value, value)
+    if value not in FONTS and get_bitmap_font(value) is None:
+        raise vol.Invalid(f"unknown font {value}, expected one of {', '.join(FONTS + font_names())}")
+    return value
+
+
+def _pixel(value: Any) -> Tuple[int, int, Color]:
+    if isinstance(value, (list, tuple)) and len(value) == 3 and isinstance(value[2], (list, tuple)):
+        # Already validated [x, y, [r, g, b, a]], e.g. a scene loaded from storage
+        value = [value[0], value[1], *value[2]]
+    if not isinstance(value, (list, tuple)) or len(value) < 5:
+        raise vol.Invalid("pixel must be [x, y, r, g, b] or [x, y, r, g, b, a]")
+    try:
+        x, y = int(value[0]), int(value[1])
+    except (TypeError, ValueError) as e:
+        raise vol.Invalid(f"invalid pixel {value}") from e
+    return x, y, valid_color(value[2:6])
+
+
+WHITE = (255, 255, 255, 255)
+
+_POSITION = {
+    vol.Required("type"): str,
+    vol.Optional("x", default=0): vol.Coerce(int),
+    vol.Optional("y", default=0): vol.Coerce(int),
+}
+_TEXT = {
+    **_POSITION,
+    vol.Optional("content", default=""): vol.Coerce(str),
+    vol.Optional("color", default=list(WHITE)): valid_color,
+    vol.Optional("font", default="5x7"): valid_font,
+    vol.Optional("spacing", default=1): vol.Coerce(int),
+}
+
+TEXT_SCHEMA = vol.Schema(_TEXT, extra=vol.ALLOW_EXTRA)
+TEXTSCROLL_SCHEMA = vol.Schema({
+    **_TEXT,
+    vol.Optional("speed", default=10): vol.All(vol.Coerce(float), vol.Range(min=0)),
+}, extra=vol.ALLOW_EXTRA)
+TEXTLONG_SCHEMA = vol.Schema({
+    **_TEXT,
+    vol.Optional("speed", default=2.0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional("scroll_duration", default=0.5): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional("direction", default="up"): vol.In(DIRECTIONS),
+}, extra=vol.ALLOW_EXTRA)
+PIXELS_SCHEMA = vol.Schema({
+    vol.Required("type"): str,
+    vol.Optional("pixels", default=[]): [_pixel],
+}, extra=vol.ALLOW_EXTRA)
+IMAGE_SCHEMA = vol.Schema({
+    **_POSITION,
+    vol.Exclusive("path", "source"): str,
+    vol.Exclusive("url", "source"): str,
+    vol.Optional("width"): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional("height"): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    # nearest keeps pixel art crisp, area averages photos down smoothly
+    vol.Optional("resample", default="nearest"): vol.In(RESAMPLE),
+}, extra=vol.ALLOW_EXTRA)
+ICON_SCHEMA = vol.Schema({
+    **_POSITION,
+    vol.Optional("name", default="mdi:help"): vol.Coerce(str),
+    vol.Optional("size", default=16): vol.All(vol.Coerce(int), vol.Range(min=1, max=256)),
+    vol.Optional("color", default=list(WHITE)): valid_color,
+}, extra=vol.ALLOW_EXTRA)
+
+_ELEMENT_SCHEMAS = {
+    "text": TEXT_SCHEMA,
+    "textscroll": TEXTSCROLL_SCHEMA,
+    "textlong": TEXTLONG_SCHEMA,
+    "pixels": PIXELS_SCHEMA,
+    "image": IMAGE_SCHEMA,
+    "icon": ICON_SCHEMA,
+}
+
+
+def valid_element(value: Any) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise vol.Invalid("element must be a mapping")
+    schema = _ELEMENT_SCHEMAS.get(value.get("type"))
+    if schema is None:
+        raise vol.Invalid(f"unknown element type: {value.get('type')}")
+    value = schema(value)
+    if value["type"] == "image" and "path" not in value and "url" not in value:
+        raise vol.Invalid("image element needs a path or url")
+    if value["type"] == "textlong" and value["speed"] + value["scroll_duration"] <= 0:
+        raise vol.Invalid("textlong speed and scroll_duration cannot both be 0")
+    return value
+
+
+# --- COMPILED ELEMENTS ---
+# Built once per draw_visuals call; the render loop only reads these fields.
+
+class TextElement:
+    __slots__ = ("x", "y", "color", "mask", "width")
+
+    def __init__(self, x: int, y: int, color: Color, mask: Mask, width: int) -> None:
+        self.x = x
+        self.y = y
+        self.color = color
+        self.mask = mask
+        self.width = width
+
+
+class TextScrollElement:
+    __slots__ = ("y", "color", "mask", "width", "speed")
+
+    def __init__(self, y: int, color: Color, mask: Mask, width: int, speed: float) -> None:
+        self.y = y
+        self.color = color
+        self.mask = mask
+        self.width = width
+        self.speed = speed
+
+
+class TextLongElement:
+    __slots__ = ("x", "y", "color", "lines", "hold", "scroll_duration", "direction", "line_h")
+
+    def __init__(self, x: int, y: int, color: Color, lines: Tuple[Mask, ...], hold: float,
+                 scroll_duration: float, direction: str, line_h: int) -> None:
+        self.x = x
+        self.y = y
+        self.color = color
+        self.lines = lines
+        self.hold = hold
+        self.scroll_duration = scroll_duration
+        self.direction = direction
+        self.line_h = line_h
+
+
+class SpriteElement:
+    # Pre-rendered sprite (pixels, icons) composited at (x, y)
+    __slots__ = ("x", "y", "layer")
+
+    def __init__(self, x: int, y: int, layer: Layer) -> None:
+        self.x = x
+        self.y = y
+        self.layer = layer
+
+
+class ImageElement:
+    __slots__ = ("x", "y", "layer")
+
+    def __init__(self, x: int, y: int, layer: Layer) -> None:
+        self.x = x
+        self.y = y
+        self.layer = layer
+
+
+def digest(value: Any) -> str:
+    # Content hash of validated service data (elements, or a whole scene)
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def is_animated(elements: list) -> bool:
+    for el in elements:
+        if isinstance(el, TextScrollElement):
+            return True
+        if isinstance(el, TextLongElement) and len(el.lines) > 1:
+            return True
+    return False
+
+
+class Scene:
+    # A compiled draw_visuals call; kept on the display's priority stack so a
+    # preempted scene can resume without being compiled again. The validated
+    # call data is kept in `definition` so the stack can be persisted.
+    __slots__ = ("elements", "background", "fps", "animated", "priority", "definition", "images", "digest",
+                 "parts", "expires", "expire_unsub")
+
+    def __init__(self, elements: list, background: Color, fps: int, priority: int = 0,
+                 definition: Optional[Dict[str, Any]] = None) -> None:
+        self.elements = elements
+        self.background = background
+        self.fps = fps
+        self.animated = is_animated(elements)
+        self.priority = priority
+        self.definition = definition
+        # Decoded source images by element index
+        self.images: Dict[int, Any] = {}
+        # Hash of (elements, background, fps), and the compiled element and
+        # source image per element hash, for reuse by the next draw_visuals call
+        self.digest: Optional[str] = None
+        self.parts: Dict[str, Tuple[Any, Any]] = {}
+        # Wall-clock time the ttl runs out, None for scenes without one
+        self.expires: Optional[float] = None
+        self.expire_unsub = None
@@ -0,0 +1,242 @@
+from __future__ import annotations
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from .bitmap_fonts import get_bitmap_font, load_font_dir
+from .cache import CACHE, ENTRY_OVERHEAD, image_cost
+from .compositor import Mask, glyph_mask
+from .fonts import FONT_3X5_DATA, FONT_5X7_DATA, AWTRIX_BITMAPS, AWTRIX_GLYPHS
+
+BUILTIN_FONTS = ("3x5", "5x7", "awtrix")
+
+# (mask, advance, x offset, y offset)
+Glyph = Tuple[Optional[Image.Image], int, int, int]
+# (mask, dx, dy) relative to the start of the run
+GlyphRun = Tuple[Tuple[Image.Image, int, int], ...]
+
+# --- TRANSLITERATION ---
+# The bitmap fonts only cover printable ASCII, so everything else is folded
+# onto it with a single str.translate pass.
+
+_SYMBOLS = {
+    '\u00a0': ' ', '\u2007': ' ', '\u2009': ' ', '\u202f': ' ',
+    '°': "'", '′': "'", '″': '"', '‘': "'", '’': "'", '‚': ',', '‛': "'",
+    '“': '"', '”': '"', '„': '"', '«': '"', '»': '"', '‹': '<', '›': '>',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+    '…': '...', '•': '*', '·': '.', '×': 'x', '÷': '/', '⁄': '/', '±': '+-',
+    '€': 'E', '£': 'L', '¥': 'Y', '¢': 'c', '©': '(c)', '®': '(R)', '™': 'TM',
+    '§': 'S', '¦': '|', '¬': '-', '¡': '!', '¿': '?', 'µ': 'u', '‰': '%',
+    '←': '<', '→': '>', '↑': '^', '↓': 'v', '≤': '<=', '≥': '>=', '≠': '!=', '≈': '~',
+}
+
+# Letters without a canonical decomposition
+_LATIN = {
+    'ł': 'l', 'Ł': 'L', 'ß': 'ss', 'ẞ': 'SS', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE',
+    'ø': 'o', 'Ø': 'O', 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'Th',
+    'ħ': 'h', 'Ħ': 'H', 'ı': 'i', 'ĸ': 'k', 'ŀ': 'l', 'Ŀ': 'L', 'ŋ': 'n', 'Ŋ': 'N',
+    'ŧ': 't', 'Ŧ': 'T', 'ƒ': 'f',
+}
+
+_CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'є': 'ye', 'і': 'i', 'ї': 'yi', 'ґ': 'g', 'ў': 'u', 'ђ': 'dj', 'ј': 'j',
+    'љ': 'lj', 'њ': 'nj', 'ћ': 'c', 'џ': 'dz', 'ѓ': 'gj', 'ќ': 'kj', 'ѕ': 'dz',
+}
+
+
+def _build_translation() -> Dict[int, str]:
+    table: Dict[int, str] = {}
+    decomposable = [range(0x00C0, 0x0250), range(0x1E00, 0x1F00), range(0x00B2, 0x00BF)]
+    for block in decomposable:
+        for code in block:
+            folded = ''.join(
+                c for c in unicodedata.normalize('NFKD', chr(code)) if not unicodedata.combining(c)
+            )
+            folded = ''.join(_SYMBOLS.get(c, c) for c in folded)
+            if folded and folded.isascii() and folded.isprintable():
+                table[code] = folded
+    for src, dst in {**_SYMBOLS, **_LATIN}.items():
+        table[ord(src)] = dst
+    for src, dst in _CYRILLIC.items():
+        table[ord(src)] = dst
+        table[ord(src.upper())] = dst.capitalize()
+    return table
+
+
+TRANSLITERATION = _build_translation()
+
+
+def sanitize_text(text: str, font_name: Optional[str] = None) -> str:
+    # User fonts keep whatever characters they have glyphs for
+    font = get_bitmap_font(font_name) if font_name else None
+    return text.translate(font.translation(TRANSLITERATION) if font else TRANSLITERATION)
+
+
+# --- GLYPHS ---
+
+@CACHE.memoize("glyphs", lambda glyph: image_cost(glyph[0]))
+def get_glyph(font_name: str, char: str) -> Glyph:
+    font = get_bitmap_font(font_name)
+    if font is not None:
+        return font.glyph(char)
+
+    img_mask = None
+    advance = 0
+    xo = yo = 0
+
+    if font_name == 'awtrix':
+        code = ord(char)
+        if 32 <= code <= 126:
+            glyph_idx = code - 32
+            if glyph_idx < len(AWTRIX_GLYPHS):
+                (bo, w, h, adv, gxo, gyo) = AWTRIX_GLYPHS[glyph_idx]
+                advance = adv
+                xo, yo = gxo, 5 + gyo
+                if w > 0 and h > 0:
+                    img_mask = Image.new('1', (w, h), 0)
+                    bits = 0
+                    bit_counter = 0
+                    current_bitmap_idx = bo
+                    for yy in range(h):
+                        for xx in range(w):
+                            if (bit_counter & 7) == 0:
+                                if current_bitmap_idx < len(AWTRIX_BITMAPS):
+                                    bits = AWTRIX_BITMAPS[current_bitmap_idx]
+                                    current_bitmap_idx += 1
+                                else:
+                                    bits = 0
+                            bit_counter += 1
+                            if bits & 0x80:
+                                img_mask.putpixel((xx, yy), 1)
+                            bits <<= 1
+        else:
+            advance = 4
+    else:
+        if font_name == '3x5':
+            font_data = FONT_3X5_DATA; char_w = 3; char_h = 5; stride = 3
+        else:
+            font_data = FONT_5X7_DATA; char_w = 5; char_h = 7; stride = 7
+
+        advance = char_w
+        code = ord(char)
+        if code * stride < len(font_data):
+            img_mask = Image.new('1', (char_w, char_h), 0)
+            offset = code * stride
+            for col in range(char_w):
+                if col >= stride: break
+                byte = font_data[offset + col]
+                for row in range(8):
+                    if row >= char_h: break
+                    if (byte >> row) & 1:
+                        img_mask.putpixel((col, row), 1)
+
+    if img_mask is None:
+        advance = 4 if font_name == 'awtrix' else (3 if font_name == '3x5' else 5)
+
+    return img_mask, advance, xo, yo
+
+
+def line_height(font_name: str) -> int:
+    font = get_bitmap_font(font_name)
+    if font is not None:
+        return font.line_height
+    return 6 if font_name == '3x5' else 8
+
+
+def _gap(font_name: str, spacing: int) -> int:
+    return spacing - 1 if font_name == 'awtrix' else spacing
+
+
+def load_user_fonts(directory: str) -> List[str]:
+    # Blocking; call from an executor. Returns the fonts added or changed.
+    changed = load_font_dir(directory, BUILTIN_FONTS)
+    if changed:
+        # Glyphs and layouts cached for a replaced font are stale
+        for cached in (get_glyph, measure_text, layout_glyphs, wrap_text):
+            cached.cache_clear()
+    return changed
+
+
+# --- LAYOUT ---
+
+@CACHE.memoize("text", lambda width: ENTRY_OVERHEAD)
+def measure_text(text: str, font_name: str, spacing: int) -> int:
+    if not text: return 0
+    width = sum(get_glyph(font_name, char)[1] for char in text)
+    return width + _gap(font_name, spacing) * (len(text) - 1)
+
+
+# Glyph masks are shared with the glyph cache; a run only adds its references
+@CACHE.memoize("text", lambda run: ENTRY_OVERHEAD + 72 * len(run[0]))
+def layout_glyphs(text: str, font_name: str, spacing: int) -> Tuple[GlyphRun, int]:
+    glyphs = []
+    cursor_x = 0
+    gap = _gap(font_name, spacing)
+
+    for char in text:
+        mask, advance, xo, yo = get_glyph(font_name, char)
+        if mask:
+            glyphs.append((mask, cursor_x + xo, yo))
+        cursor_x += advance + gap
+
+    width = cursor_x - gap if text else 0
+    return tuple(glyphs), width
+
+
+# The whole run as one coverage mask, blended into a frame in one step
+@CACHE.memoize("text", lambda run: ENTRY_OVERHEAD + run[0][0].nbytes)
+def layout_mask(text: str, font_name: str, spacing: int) -> Tuple[Mask, int]:
+    glyphs, width = layout_glyphs(text, font_name, spacing)
+    return glyph_mask(glyphs), width
+
+
+def _break_word(word: str, font_name: str, spacing: int, max_width: int) -> List[str]:
+    if measure_text(word, font_name, spacing) <= max_width:
+        return [word]
+    gap = _gap(font_name, spacing)
+    pieces = []
+    start = 0
+    piece_width = 0
+    for i, char in enumerate(word):
+        advance = get_glyph(font_name, char)[1]
+        if i > start and piece_width + gap + advance > max_width:
+            pieces.append(word[start:i])
+            start = i
+            piece_width = advance
+        else:
+            piece_width += advance + (gap if i > start else 0)
+    pieces.append(word[start:])
+    return pieces
+
+
+@CACHE.memoize("text", lambda lines: ENTRY_OVERHEAD + sum(len(line) + 56 for line in lines))
+def wrap_text(text: str, font_name: str, spacing: int, max_width: int) -> Tuple[str, ...]:
+    lines = []
+    current_line: List[str] = []
+    current_line_width = 0
+    actual_space_px = get_glyph(font_name, ' ')[1] + _gap(font_name, spacing)
+
+    for word in text.split(' '):
+        for piece in _break_word(word, font_name, spacing, max_width):
+            piece_width = measure_text(piece, font_name, spacing)
+
+            if not current_line:
+                current_line.append(piece)
+                current_line_width = piece_width
+            else:
+                new_width = current_line_width + actual_space_px + piece_width
+                if new_width <= max_width:
+                    current_line.append(piece)
+                    current_line_width = new_width
+                else:
+                    lines.append(" ".join(current_line))
+                    current_line = [piece]
+                    current_line_width = piece_width
+
+    if current_line:
+        lines.append(" ".join(current_line))
+
+    return tuple(lines)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# Headless UMP scene renderer: render a draw_visuals scene (JSON/YAML, like the
+# files in examples/) to a PNG, an animated GIF, or a benchmark report.
+#
+#   python tools/ump_render.py examples/sensorsexample.yaml -o out.png
+#   python tools/ump_render.py examples/script_demo/script_demo.yaml --step 1 -o music.gif --duration 6
+#   python tools/ump_render.py scene.json --size 64x16 --bench --fps 15 --duration 30
+#
+# Needs Pillow, NumPy and voluptuous (and PyYAML for .yaml files); not Home Assistant.
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import voluptuous as vol  # noqa: E402
+from PIL import Image  # noqa: E402
+from custom_components.unexpected_matrix_pixels.cache import CACHE  # noqa: E402
+from custom_components.unexpected_matrix_pixels.renderer import SceneRenderer, decode_image, encode_frame  # noqa: E402
+from custom_components.unexpected_matrix_pixels.scene import valid_color, valid_element, is_animated  # noqa: E402
+from custom_components.unexpected_matrix_pixels.text import load_user_fonts  # noqa: E402
+
+
+def load_scenes(path: str) -> list:
+    # Every draw_visuals data mapping in the file
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                sys.exit("PyYAML is required to read YAML scenes (pip install pyyaml)")
+            doc = yaml.safe_load(f)
+        else:
+            doc = json.load(f)
+
+    if isinstance(doc, list):
+        return [{"elements": doc}]
+    if "sequence" in doc:
+        # A script: its draw_visuals calls
+        calls = [
+            s["data"] for s in doc["sequence"]
+            if isinstance(s, dict) and str(s.get("action", s.get("service", ""))).endswith("draw_visuals")
+        ]
+        if not calls:
+            sys.exit(f"{path}: no draw_visuals steps in script")
+        return calls
+    return [doc.get("data", doc)]
+
+
+def load_scene_data(path: str, step: int) -> dict:
+    scenes = load_scenes(path)
+    if not 0 <= step < len(scenes):
+        sys.exit(f"{path}: --step must be between 0 and {len(scenes) - 1}")
+    return scenes[step]
+
+
+def fetch_image(el: dict, base_dir: str):
+    try:
+        if "path" in el:
+            with open(os.path.join(base_dir, el["path"]), "rb") as f:
+                data = f.read()
+        else:
+            with urllib.request.urlopen(el["url"], timeout=10) as response:
+                data = response.read()
+    except OSError as e:
+        print(f"warning: could not load image {el.get('path', el.get('url'))}: {e}", file=sys.stderr)
+        return None
+    return decode_image(data, el.get("width"), el.get("height"), el.get("resample", "nearest"))
+
+
+def compile_scene(data: dict, renderer: SceneRenderer, base_dir: str):
+    elements = data.get("elements", [])
+    if not isinstance(elements, list):
+        sys.exit("elements must be a list (Jinja templates are not rendered here)")
+    try:
+        elements = [valid_element(el) for el in elements]
+        background = valid_color(data.get("background", [0, 0, 0]))
+    except vol.Invalid as e:
+        sys.exit(f"invalid scene: {e}")
+    images = {idx: fetch_image(el, base_dir) for idx, el in enumerate(elements) if el["type"] == "image"}
+    return renderer.compile_elements(elements, {k: v for k, v in images.items() if v}), background
+
+
+def encode_png(frame) -> bytes:
+    # Same encoding as UmpBleClient.send_frame_png
+    return encode_frame(frame, *frame.size)
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_bench(renderer, compiled, background, fps: int, duration: float, start: float, compile_ms: float) -> None:
+    frame_count = max(1, int(fps * duration))
+    render_ms, encode_ms, sizes = [], [], []
+    for i in range(frame_count):
+        t0 = time.perf_counter()
+        frame = renderer.render(compiled, background, start + i / fps)
+        t1 = time.perf_counter()
+        payload = encode_png(frame)
+        t2 = time.perf_counter()
+        render_ms.append((t1 - t0) * 1000)
+        encode_ms.append((t2 - t1) * 1000)
+        sizes.append(len(payload))
+
+    total_ms = [r + e for r, e in zip(render_ms, encode_ms)]
+    budget_ms = 1000 / fps
+    print(f"scene:       {len(compiled)} elements, animated={is_animated(compiled)}, {renderer.size[0]}x{renderer.size[1]}")
+    print(f"compile:     {compile_ms:.2f} ms")
+    print(f"frames:      {frame_count} at {fps} fps ({duration:g} s simulated)")
+    for label, values in (("render", render_ms), ("png encode", encode_ms), ("total", total_ms)):
+        print(
+            f"{label + ':':<12} mean {statistics.mean(values):.3f} ms  p50 {percentile(values, 50):.3f}  "
+            f"p95 {percentile(values, 95):.3f}  p99 {percentile(values, 99):.3f}  max {max(values):.3f}"
+        )
+    print(f"payload:     mean {statistics.mean(sizes):.0f} bytes, max {max(sizes)} bytes")
+    print(f"cpu budget:  {statistics.mean(total_ms) / budget_ms * 100:.1f}% of the {budget_ms:.1f} ms frame time")
+    print(f"max fps:     {1000 / statistics.mean(total_ms):.0f} (render + encode, single core)")
+    stats = CACHE.stats()
+    regions = ", ".join(f"{name} {r['hits']}/{r['hits'] + r['misses']}" for name, r in stats["regions"].items())
+    print(f"cache:       {stats['bytes'] / 1024:.0f} KiB of {stats['budget'] / 2**20:.0f} MiB, hits {regions or '-'}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render a UMP draw_visuals scene without Home Assistant.")
+    parser.add_argument("scene", help="scene file: service call, script, data mapping or element list (JSON/YAML)")
+    parser.add_argument("-o", "--output", help="output file; .png renders one frame, .gif an animation")
+    parser.add_argument("--size", default="32x32", help="panel size WIDTHxHEIGHT (default 32x32)")
+    parser.add_argument("--step", type=int, default=0, help="draw_visuals step to use when the file is a script")
+    parser.add_argument("--fps", type=int, help="frames per second (default: the scene's fps, or 10)")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to render for GIF/bench (default 5)")
+    parser.add_argument("--start", type=float, default=0.0, help="animation clock at the first frame (default 0)")
+    parser.add_argument("--scale", type=int, default=1, help="nearest-neighbour upscale for PNG/GIF output")
+    parser.add_argument("--bench", action="store_true", help="print a render/encode timing report")
+    parser.add_argument("--fonts", help="directory of BDF/PCF fonts (like <config>/ump_fonts)")
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.bench:
+        parser.error("nothing to do: pass --output and/or --bench")
+    try:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+    except ValueError:
+        parser.error("--size must look like 32x32")
+
+    if args.fonts:
+        load_user_fonts(args.fonts)
+    data = load_scene_data(args.scene, args.step)
+    fps = max(1, min(30, args.fps or int(data.get("fps", 10))))
+    renderer = SceneRenderer(width, height)
+
+    t0 = time.perf_counter()
+    compiled, background = compile_scene(data, renderer, os.path.dirname(os.path.abspath(args.scene)))
+    compile_ms = (time.perf_counter() - t0) * 1000
+
+    def scaled(frame):
+        if args.scale > 1:
+            return frame.resize((width * args.scale, height * args.scale), Image.Resampling.NEAREST)
+        return frame
+
+    if args.output:
+        if args.output.lower().endswith(".gif"):
+            frame_count = max(1, int(fps * args.duration))
+            frames = [
+                scaled(renderer.render(compiled, background, args.start + i / fps))
+                for i in range(frame_count)
+            ]
+            frames[0].save(
+                args.output, save_all=True, append_images=frames[1:],
+                duration=int(1000 / fps), loop=0, optimize=False,
+            )
+        else:
+            scaled(renderer.render(compiled, background, args.start)).save(args.output)
+        print(f"wrote {args.output}")
+
+    if args.bench:
+        run_bench(renderer, compiled, background, fps, args.duration, args.start, compile_ms)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
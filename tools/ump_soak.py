@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# Multi-display soak test: drives N IDMDisplayEntity instances on one event
+# loop, each backed by a simulated BLE panel, and reports event-loop lag,
+# achieved fps per panel (frames rendered by the animation clock; unchanged
+# frames are then dropped by the client, so BLE frames are listed apart),
+# CPU use and memory growth.
+#
+#   python tools/ump_soak.py --panels 8 --duration 120
+#   python tools/ump_soak.py --panels 16 --latency-ms 15 --drop-rate 0.01 --disconnect-rate 0.001 --proxies 3
+#
+# Needs the integration's runtime requirements (homeassistant, bleak,
+# bleak-retry-connector, Pillow, NumPy); no Home Assistant instance is started.
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ump_render import load_scenes  # noqa: E402
+from custom_components.unexpected_matrix_pixels import ble_client  # noqa: E402
+from custom_components.unexpected_matrix_pixels.animation import async_get_clock  # noqa: E402
+from custom_components.unexpected_matrix_pixels.ble_client import async_get_client  # noqa: E402
+from custom_components.unexpected_matrix_pixels.ble_scheduler import ConnectionScheduler  # noqa: E402
+from custom_components.unexpected_matrix_pixels.const import DATA_SCHEDULER  # noqa: E402
+from custom_components.unexpected_matrix_pixels.light import IDMDisplayEntity  # noqa: E402
+from custom_components.unexpected_matrix_pixels.scene import valid_color, valid_element  # noqa: E402
+
+# First write of every frame upload (see UmpBleClient._write_frame)
+FRAME_START = bytes([10, 0, 5, 1, 0, 0, 0, 0, 0, 0])
+
+
+class SoakConfig:
+    __slots__ = ("latency", "jitter", "connect_latency", "drop_rate", "disconnect_rate", "rng")
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter_ms / 1000
+        self.connect_latency = args.connect_ms / 1000
+        self.drop_rate = args.drop_rate
+        self.disconnect_rate = args.disconnect_rate
+        self.rng = random.Random(args.seed)
+
+
+class PanelStats:
+    __slots__ = ("frames", "writes", "bytes", "drops", "disconnects", "connects")
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self.writes = 0
+        self.bytes = 0
+        self.drops = 0
+        self.disconnects = 0
+        self.connects = 0
+
+
+class SimulatedPanel:
+    # Stands in for the BleakClient returned by establish_connection
+    def __init__(self, config: SoakConfig, stats: PanelStats, disconnected_callback) -> None:
+        self._config = config
+        self._stats = stats
+        self._disconnected_callback = disconnected_callback
+        self.is_connected = True
+
+    async def write_gatt_char(self, char, data, response: bool = False) -> None:
+        config = self._config
+        if not self.is_connected:
+            raise ConnectionError("simulated panel disconnected")
+        await asyncio.sleep(max(0.0, config.latency + config.rng.uniform(-config.jitter, config.jitter)))
+        if config.rng.random() < config.disconnect_rate:
+            self._stats.disconnects += 1
+            self.is_connected = False
+            self._disconnected_callback(self)
+            raise ConnectionError("simulated link loss")
+        if config.rng.random() < config.drop_rate:
+            self._stats.drops += 1
+            raise TimeoutError("simulated dropped write")
+        self._stats.writes += 1
+        self._stats.bytes += len(data)
+        if bytes(data) == FRAME_START:
+            self._stats.frames += 1
+
+    async def disconnect(self) -> None:
+        self.is_connected = False
+
+
+class SimulatedBluetooth:
+    # Fake bluetooth manager for the connection scheduler plus a drop-in for
+    # bleak_retry_connector.establish_connection
+    def __init__(self, config: SoakConfig, proxies: int, slots: int) -> None:
+        self._config = config
+        self._sources = [f"proxy{i}" for i in range(proxies)]
+        self._slots = slots
+        self.stats: Dict[str, PanelStats] = {}
+
+    def candidates(self, address: str):
+        return [(source, address, -55 - 5 * i) for i, source in enumerate(self._sources)]
+
+    def slots(self, source: str) -> int:
+        return self._slots
+
+    def allocated(self, source: str):
+        return None  # only the soak panels use the simulated proxies
+
+    def connected_source(self, address: str, client) -> None:
+        return None  # links go where the scheduler asked
+
+    async def establish_connection(self, client_class, device, name, disconnected_callback=None, **kwargs):
+        await asyncio.sleep(self._config.connect_latency)
+        stats = self.stats.setdefault(name, PanelStats())
+        stats.connects += 1
+        return SimulatedPanel(self._config, stats, disconnected_callback)
+
+
+class MemoryStore:
+    # Replaces the entity's homeassistant.helpers.storage.Store
+    async def async_load(self):
+        return None
+
+    def async_delay_save(self, data_func, delay: float = 0) -> None:
+        pass
+
+
+class _Config:
+    def is_allowed_path(self, path: str) -> bool:
+        return True
+
+
+class _Bus:
+    def __init__(self) -> None:
+        self.listeners: List[tuple] = []
+
+    def async_listen_once(self, event_type: str, listener):
+        entry = (event_type, listener)
+        self.listeners.append(entry)
+
+        def unsubscribe() -> None:
+            if entry in self.listeners: self.listeners.remove(entry)
+        return unsubscribe
+
+
+class SoakHass:
+    # The slice of HomeAssistant the integration touches at runtime
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.data: dict = {}
+        self.config = _Config()
+        self.bus = _Bus()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="soak-executor")
+        self._tasks: set = set()
+
+    def async_create_task(self, coro, name=None, eager_start=False):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async_create_background_task = async_create_task
+
+    def async_add_executor_job(self, target, *args):
+        return self.loop.run_in_executor(self._executor, target, *args)
+
+    async def async_stop(self) -> None:
+        # Like Home Assistant: stop listeners run, config entries are not unloaded
+        listeners, self.bus.listeners = self.bus.listeners, []
+        for event_type, listener in listeners:
+            await listener(SimpleNamespace(event_type=event_type))
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is a high-water mark (KiB on Linux, bytes on macOS)
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def measure_lag(interval: float, samples: List[float], stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval) * 1000)
+
+
+async def sample_memory(period: float, samples: List[tuple], stop: asyncio.Event) -> None:
+    start = time.monotonic()
+    while not stop.is_set():
+        samples.append((time.monotonic() - start, rss_bytes()))
+        try:
+            await asyncio.wait_for(stop.wait(), period)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args: argparse.Namespace) -> dict:
+    loop = asyncio.get_running_loop()
+    config = SoakConfig(args)
+    bt = SimulatedBluetooth(config, args.proxies, args.slots)
+    ble_client.establish_connection = bt.establish_connection
+
+    hass = SoakHass(loop)
+    hass.data[DATA_SCHEDULER] = ConnectionScheduler(bt)
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    scenes = load_scenes(args.scenes)
+    if args.render_workers:
+        await async_get_clock(hass).async_use_process_pool(args.render_workers)
+
+    displays = []
+    for i in range(args.panels):
+        mac = f"AA:BB:CC:00:{i // 256:02X}:{i % 256:02X}"
+        client = async_get_client(hass, mac, width, height)
+        display = IDMDisplayEntity(client, mac, f"soak {i}", hass, width, height)
+        display._store = MemoryStore()
+        displays.append((mac, display))
+
+    # Frames the clock rendered and handed over, whether or not they were
+    # then written (the client drops frames identical to the panel's)
+    rendered: Dict[str, int] = {mac: 0 for mac, _ in displays}
+
+    def count_frames(mac: str, send):
+        def send_counted(png_data: bytes) -> None:
+            rendered[mac] += 1
+            send(png_data)
+        return send_counted
+
+    for mac, display in displays:
+        display._send_animation_frame = count_frames(mac, display._send_animation_frame)
+
+    stop = asyncio.Event()
+    lag_samples: List[float] = []
+    mem_samples: List[tuple] = []
+    probes = [
+        loop.create_task(measure_lag(args.lag_interval / 1000, lag_samples, stop)),
+        loop.create_task(sample_memory(1.0, mem_samples, stop)),
+    ]
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+
+    targets = {}
+    for i, (mac, display) in enumerate(displays):
+        data = scenes[i % len(scenes)]
+        elements = [valid_element(el) for el in data.get("elements", [])]
+        fps = max(1, min(30, args.fps or int(data.get("fps", 10))))
+        targets[mac] = fps
+        await display.async_draw_visuals(elements, valid_color(data.get("background", [0, 0, 0])), fps)
+
+    await asyncio.sleep(args.duration)
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    animated = {mac: bool(display._scenes and display._scenes[-1].animated) for mac, display in displays}
+
+    stop.set()
+    await asyncio.gather(*probes)
+    for _, display in displays:
+        await display.async_will_remove_from_hass()
+    await hass.async_stop()
+
+    panels = {}
+    for mac, display in displays:
+        stats = bt.stats.get(mac, PanelStats())
+        panels[mac] = {
+            "animated": animated[mac],
+            "target_fps": targets[mac],
+            "fps": round(rendered[mac] / wall, 2),
+            "frames": rendered[mac],
+            "ble_frames": stats.frames,
+            "kbytes": round(stats.bytes / 1024, 1),
+            "drops": stats.drops,
+            "disconnects": stats.disconnects,
+            "connects": stats.connects,
+        }
+
+    mem_start = mem_samples[0][1] if mem_samples else 0
+    mem_end = mem_samples[-1][1] if mem_samples else 0
+    growth_per_min = 0.0
+    if len(mem_samples) > 2:
+        # Least-squares slope over the run, ignoring the warm-up first tenth
+        tail = mem_samples[len(mem_samples) // 10:]
+        xs = [t for t, _ in tail]
+        ys = [m for _, m in tail]
+        mean_x, mean_y = statistics.mean(xs), statistics.mean(ys)
+        var = sum((x - mean_x) ** 2 for x in xs)
+        if var:
+            growth_per_min = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var * 60
+
+    return {
+        "panels": args.panels,
+        "duration_s": round(wall, 1),
+        "loop_lag_ms": {
+            "p50": round(percentile(lag_samples, 50), 2),
+            "p95": round(percentile(lag_samples, 95), 2),
+            "p99": round(percentile(lag_samples, 99), 2),
+            "max": round(max(lag_samples, default=0.0), 2),
+        },
+        "cpu_percent": round(cpu / wall * 100, 1),
+        "rss_mb": {
+            "start": round(mem_start / 2**20, 1),
+            "end": round(mem_end / 2**20, 1),
+            "growth_mb_per_min": round(growth_per_min / 2**20, 3),
+        },
+        "per_panel": panels,
+    }
+
+
+def print_report(report: dict) -> None:
+    lag = report["loop_lag_ms"]
+    rss = report["rss_mb"]
+    print(f"panels:        {report['panels']} over {report['duration_s']} s")
+    print(f"loop lag (ms): p50 {lag['p50']}  p95 {lag['p95']}  p99 {lag['p99']}  max {lag['max']}")
+    print(f"cpu:           {report['cpu_percent']}% of one core")
+    print(f"rss (MB):      {rss['start']} -> {rss['end']}  ({rss['growth_mb_per_min']:+} MB/min)")
+    print(
+        f"{'panel':<20} {'anim':<5} {'target':>6} {'fps':>6} {'frames':>7} {'ble':>6} "
+        f"{'kB':>8} {'drops':>6} {'disc':>5} {'conn':>5}"
+    )
+    for mac, p in report["per_panel"].items():
+        # Static panels render once: there is no rate to compare
+        fps = p['fps'] if p['animated'] else "-"
+        print(
+            f"{mac:<20} {'yes' if p['animated'] else 'no':<5} {p['target_fps']:>6} {fps:>6} "
+            f"{p['frames']:>7} {p['ble_frames']:>6} {p['kbytes']:>8} {p['drops']:>6} {p['disconnects']:>5} {p['connects']:>5}"
+        )
+
+
+def main(argv=None) -> int:
+    default_scenes = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "script_demo", "script_demo.yaml")
+    parser = argparse.ArgumentParser(description="Soak-test N simulated UMP panels on one event loop.")
+    parser.add_argument("--panels", type=int, default=4, help="number of displays (default 4)")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run (default 60)")
+    parser.add_argument("--scenes", default=default_scenes, help="scene file; panels cycle through its draw_visuals steps")
+    parser.add_argument("--size", default="32x32", help="panel size WIDTHxHEIGHT (default 32x32)")
+    parser.add_argument("--fps", type=int, help="override every scene's fps")
+    parser.add_argument("--latency-ms", type=float, default=8.0, help="per-write BLE latency (default 8)")
+    parser.add_argument("--jitter-ms", type=float, default=4.0, help="+/- random latency jitter (default 4)")
+    parser.add_argument("--connect-ms", type=float, default=500.0, help="connection setup time (default 500)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability a write fails (default 0)")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="probability a write drops the link (default 0)")
+    parser.add_argument("--proxies", type=int, default=2, help="simulated adapters/proxies (default 2)")
+    parser.add_argument("--slots", type=int, default=3, help="connection slots per proxy (default 3)")
+    parser.add_argument("--render-workers", type=int, default=0, help="render heavy scenes in N worker processes")
+    parser.add_argument("--lag-interval", type=float, default=10.0, help="loop lag probe period in ms (default 10)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the simulation")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the integration's log output")
+    args = parser.parse_args(argv)
+
+    # Simulated drops make the integration log an error per failed frame
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())